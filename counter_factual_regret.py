@@ -1,7 +1,6 @@
 #http://modelai.gettysburg.edu/2013/cfr/cfr.pdf
 
 import numpy as np
-import random
 
 '''
 Algorithm
@@ -23,9 +22,10 @@ class RPSTrainer():
     SCISSORS = 2
     NUM_ACTIONS = 3
 
-    regret_sum = [0.0] * NUM_ACTIONS
-    strategy_sum = [0.0] * NUM_ACTIONS
-    opp_strategy = [0.4, 0.3, 0.3]
+    def __init__(self):
+        self.regret_sum = [0.0] * self.NUM_ACTIONS
+        self.strategy_sum = [0.0] * self.NUM_ACTIONS
+        self.opp_strategy = [0.4, 0.3, 0.3]
 
     def get_strategy(self):
         normalizing_sum = 0.0
@@ -115,9 +115,145 @@ class RPSTrainer():
         return avg_strategy
 
 
+# RPS_PAYOFFS[my_action][other_action] - the action utilities RPSTrainer.compute_action_utilities computes
+RPS_PAYOFFS = [[0, -1, 1],
+               [1, 0, -1],
+               [-1, 1, 0]]
+
+
+class NormalFormTrainer:
+    """
+    Regret matching for any two player normal-form game, training a batch of independent solvers at once. Regrets and
+    strategy sums are (batch, actions) arrays, row b being solver b. It shares no code with RPSTrainer, whose methods
+    work on a single solver's lists.
+
+    Like RPSTrainer each solver samples both players' actions from their strategies and accumulates the sampled
+    regrets, but a solver's strategy is only recomputed every block_size iterations. The actions of a block are drawn
+    together as counts of every (my_action, other_action) pair, so a block costs the same whatever its size.
+    The default block_size=1 is exactly RPSTrainer's update, larger blocks trade that for speed and must be asked for.
+
+    With an opp_strategy the solvers learn to play against it. Without one the game is taken as zero sum and the
+    opponent regret matches too, the average strategies of both players approaching an equilibrium.
+    """
+
+    def __init__(self, payoffs=RPS_PAYOFFS, opp_strategy=None, batch=1, block_size=1, seed=None):
+        """
+        :param payoffs:      array (actions, other actions) or (batch, actions, other actions) - my utilities
+        :param opp_strategy: array (other actions) or (batch, other actions) - fixed opponent strategy, or None
+        :param batch:        int - solvers to train, when neither payoffs nor opp_strategy has a batch dimension
+        :param block_size:   int - iterations between strategy updates, 1 to update after every iteration
+        :param seed:         int
+        """
+        payoffs = np.asarray(payoffs, dtype=float)
+        if payoffs.ndim == 2:
+            payoffs = payoffs[np.newaxis]
+        if opp_strategy is not None:
+            opp_strategy = np.asarray(opp_strategy, dtype=float)
+            batch = max(batch, opp_strategy.shape[0] if opp_strategy.ndim == 2 else 1)
+        batch = max(batch, payoffs.shape[0])
+
+        self.payoffs = np.broadcast_to(payoffs, (batch,) + payoffs.shape[1:])
+        self.NUM_ACTIONS, self.NUM_OTHER_ACTIONS = self.payoffs.shape[1:]
+        self.batch = batch
+        self.block_size = block_size
+        self.random = np.random.default_rng(seed)
+        self.regret_sum = np.zeros((batch, self.NUM_ACTIONS))
+        self.strategy_sum = np.zeros((batch, self.NUM_ACTIONS))
+        self.self_play = opp_strategy is None
+        if self.self_play:
+            self.opp_regret_sum = np.zeros((batch, self.NUM_OTHER_ACTIONS))
+            self.opp_strategy_sum = np.zeros((batch, self.NUM_OTHER_ACTIONS))
+        else:
+            self.opp_strategy = np.broadcast_to(opp_strategy, (batch, self.NUM_OTHER_ACTIONS))
+        self.iteration = 0
+
+    @staticmethod
+    def regret_matching(regret_sum):
+        """
+        :param regret_sum: array (batch, actions)
+        :return: array (batch, actions) - regret-matched strategy of each solver
+        """
+        strategy = np.maximum(regret_sum, 0.0)
+        normalizing_sum = strategy.sum(axis=1, keepdims=True)
+        uniform = normalizing_sum[:, 0] <= 0
+        strategy[uniform] = 1.0
+        normalizing_sum[uniform] = strategy.shape[1]
+        return strategy / normalizing_sum
+
+    def get_strategy(self):
+        """
+        Unlike RPSTrainer.get_strategy, nothing is added to strategy_sum, train() weights it by the block size
+        :return: array (batch, actions)
+        """
+        return self.regret_matching(self.regret_sum)
+
+    def get_action_counts(self, strategy, opp_strategy, iterations):
+        """
+        Draw a block of iterations' actions
+        :param strategy:     array (batch, actions)
+        :param opp_strategy: array (batch, other actions)
+        :param iterations:   int
+        :return: array (batch, actions, other actions) - times each pair of actions was played
+        """
+        joint = (strategy[:, :, np.newaxis] * opp_strategy[:, np.newaxis, :]).reshape(self.batch, -1)
+        joint /= joint.sum(axis=1, keepdims=True)
+        counts = self.random.multinomial(iterations, joint).astype(float)
+        return counts.reshape(self.batch, self.NUM_ACTIONS, self.NUM_OTHER_ACTIONS)
+
+    def train(self, iterations=1000000):
+        """
+        Further calls continue from where the last one stopped
+        :param iterations: int
+        """
+        for start in range(0, iterations, self.block_size):
+            block = min(self.block_size, iterations - start)
+            strategy = self.get_strategy()
+            opp_strategy = self.regret_matching(self.opp_regret_sum) if self.self_play else self.opp_strategy
+            self.strategy_sum += block * strategy
+
+            counts = self.get_action_counts(strategy, opp_strategy, block)
+            # Sum over the block of u(my_action, other_action)
+            realized = np.einsum('bij,bij->b', counts, self.payoffs)[:, np.newaxis]
+            # u(s'_i, s_-i) - u(a) for every iteration of the block
+            other_counts = counts.sum(axis=1)[:, :, np.newaxis]
+            self.regret_sum += (self.payoffs @ other_counts)[:, :, 0] - realized
+            if self.self_play:
+                self.opp_strategy_sum += block * opp_strategy
+                my_counts = counts.sum(axis=2)[:, np.newaxis, :]
+                self.opp_regret_sum += realized - (my_counts @ self.payoffs)[:, 0, :]
+        self.iteration += iterations
+
+    def get_average_strategy(self):
+        """
+        :return: array (batch, actions)
+        """
+        return self._average(self.strategy_sum)
+
+    def get_average_opp_strategy(self):
+        """
+        Only trained without a fixed opp_strategy
+        :return: array (batch, other actions)
+        """
+        return self._average(self.opp_strategy_sum)
+
+    @staticmethod
+    def _average(strategy_sum):
+        normalizing_sum = strategy_sum.sum(axis=1, keepdims=True)
+        avg_strategy = np.full_like(strategy_sum, 1.0 / strategy_sum.shape[1])
+        np.divide(strategy_sum, normalizing_sum, out=avg_strategy, where=normalizing_sum > 0)
+        return avg_strategy
+
+
 def main():
     trainer = RPSTrainer()
     trainer.train(1000000)
     print(trainer.get_average_strategy())
 
-main()
\ No newline at end of file
+    # A strategy update every 1000 iterations keeps a million iterations of 1000 solvers to a thousand steps
+    trainer = NormalFormTrainer(opp_strategy=[0.4, 0.3, 0.3], batch=1000, block_size=1000)
+    trainer.train(1000000)
+    print(trainer.get_average_strategy().mean(axis=0))
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -1,81 +1,126 @@
 import random
+from itertools import permutations
+import numpy as np
+
+CARDS = [1, 2, 3]
+# Histories a player acts after
+HISTORIES = ['', 'b', 'p', 'pb']
+INFO_SETS = [str(card) + history for card in CARDS for history in HISTORIES]
+DEALS = [list(deal) for deal in permutations(CARDS, 2)]
 
 
 class Node:
-    # Information set node class definition
+    """
+    Information set node: a view of one info set's row of the trainer's regret_sum and strategy_sum arrays. A node
+    built on its own owns its rows
+    """
 
     NUM_ACTIONS = 2
 
-    def __init__(self, info_set=''):
+    def __init__(self, info_set='', regret_sum=None, strategy_sum=None):
         # Kuhn Node Definitions
         self.info_set = info_set
-        self.regret_sum = [0] * self.NUM_ACTIONS
-        self.strategy_sum = [0] * self.NUM_ACTIONS
+        self.regret_sum = regret_sum if regret_sum is not None else np.zeros(self.NUM_ACTIONS)
+        self.strategy_sum = strategy_sum if strategy_sum is not None else np.zeros(self.NUM_ACTIONS)
 
     def get_strategy(self, realization_weight):
         """
         Get current information set mixed strategy through regret matching
-        :param realization_weight:
-        :return:
+        :param realization_weight: float - reach probability of the acting player
+        :return: np.array
         """
-        normalizing_sum = 0.0
-        strategy = [0.0] * self.NUM_ACTIONS
-        for a in range(0, self.NUM_ACTIONS):
-            # Do not consider negative regrets in determining strategy
-            strategy[a] = max(self.regret_sum[a], 0)
-            normalizing_sum += strategy[a]
-
-        for i in range(0, self.NUM_ACTIONS):
-            if normalizing_sum > 0:
-                strategy[i] /= normalizing_sum
-            else:
-                strategy[i] = 1.0 / self.NUM_ACTIONS
-
-            self.strategy_sum[i] += realization_weight * strategy[i]
-
+        strategy = regret_matching(self.regret_sum)
+        self.strategy_sum += realization_weight * strategy
         return strategy
 
     def get_average_strategy(self):
         """
         Get average information set mixed strategy across all training iterations
-        :return:
+        :return: np.array
         """
-        avg_strategy = [0] * self.NUM_ACTIONS
-        normalizing_sum = 0.0
-        for a in range(0, self.NUM_ACTIONS):
-            normalizing_sum += self.strategy_sum[a]
-
-        for a in range(0, self.NUM_ACTIONS):
-            if normalizing_sum > 0:
-                avg_strategy[a] = self.strategy_sum[a] / normalizing_sum
-            else:
-                avg_strategy[a] = 1.0 / self.NUM_ACTIONS
-
-        return avg_strategy
+        return average_strategy(self.strategy_sum)
 
     def to_string(self):
         # Get info set string representation
         avg_strat = self.get_average_strategy()
-        print('info_set is: {0} and average strategy for BET: {1.4f} PASS: {2:.4f}'.format(self.info_set, avg_strat[0], avg_strat[1]))
+        print('info_set is: {0} and average strategy for Pass: {1:.4f} Bet: {2:.4f}'.format(
+            self.info_set, avg_strat[0], avg_strat[1]))
+
+
+def regret_matching(regret_sum, out=None):
+    """
+    :param regret_sum: np.array (..., actions)
+    :param out:        np.array - same shape as regret_sum, written in place instead of allocating the result
+    :return: np.array - strategy proportional to the positive regrets, uniform where none is positive
+    """
+    strategy = np.maximum(regret_sum, 0.0, out=out)
+    normalizing_sum = strategy.sum(axis=-1, keepdims=True)
+    np.divide(strategy, normalizing_sum, out=strategy, where=normalizing_sum > 0)
+    strategy[normalizing_sum[..., 0] <= 0] = 1.0 / strategy.shape[-1]
+    return strategy
+
+
+def average_strategy(strategy_sum):
+    """
+    :param strategy_sum: np.array (..., actions)
+    :return: np.array - normalized strategy sums, uniform where nothing was accumulated
+    """
+    return regret_matching(strategy_sum)
 
 
 class KuhnTrainer:
+    """
+    Two player Kuhn Poker trained with CFR. All state belongs to the instance, so any number of trainers can run side
+    by side in one process or pool.
+
+    Info sets are fixed - a card followed by one of the HISTORIES - so the node table is a pair of arrays indexed by
+    info set: regret_sum[i, a] and strategy_sum[i, a] for info set INFO_SETS[i]. node_map holds a Node view of each
+    row.
+
+    Each iteration either walks all 6 deals, weighting their utilities by the chance of the deal, or samples one deal
+    from the trainer's own seeded RNG (exhaustive=False). Every deal of an iteration plays the strategy regret matched
+    at the start of the iteration, and the regret and strategy deltas of all its deals are applied together at the end.
+    """
     # Kuhn Poker Definitions
     PASS = 0
-    BEST = 1
+    BET = 1
+    # Original, misspelled name of BET
+    BEST = BET
     NUM_ACTIONS = 2
-    node_map = {'1': Node('1'), '1b': Node('1b'), '1p': Node('1p'), '1pb': Node('1pb'),
-                '2': Node('2'), '2b': Node('2b'), '2p': Node('2p'), '2pb': Node('2pb'),
-                '3': Node('3'), '3b': Node('3b'), '3p': Node('3p'), '3pb': Node('3pb')}
+
+    def __init__(self, exhaustive=True, seed=None):
+        """
+        :param exhaustive: bool - walk every deal each iteration instead of sampling one
+        :param seed:       int  - seed of the RNG sampling deals
+        """
+        self.exhaustive = exhaustive
+        self.random = random.Random(seed)
+        self.regret_sum = np.zeros((len(INFO_SETS), self.NUM_ACTIONS))
+        self.strategy_sum = np.zeros((len(INFO_SETS), self.NUM_ACTIONS))
+        self.node_map = {info_set: Node(info_set, self.regret_sum[i], self.strategy_sum[i])
+                         for i, info_set in enumerate(INFO_SETS)}
+        # Row of the info set of holding a card after a history: info_set_index[card][history]
+        self.info_set_index = {card: {history: INFO_SETS.index(str(card) + history) for history in HISTORIES}
+                               for card in CARDS}
+        self.iteration = 0
+        self.util = 0.0
+        # Per iteration buffers: the strategy played, and the regret and strategy sums added after the iteration's deals.
+        # cfr reads and writes them one entry at a time through flat memoryviews (row i * NUM_ACTIONS + action)
+        self._strategy = np.zeros((len(INFO_SETS), self.NUM_ACTIONS))
+        self._regret_delta = np.zeros((len(INFO_SETS), self.NUM_ACTIONS))
+        self._strategy_delta = np.zeros((len(INFO_SETS), self.NUM_ACTIONS))
+        self._flat_strategy = memoryview(self._strategy).cast('B').cast('d')
+        self._flat_regret_delta = memoryview(self._regret_delta).cast('B').cast('d')
+        self._flat_strategy_delta = memoryview(self._strategy_delta).cast('B').cast('d')
 
     def cfr(self, cards, history, rp0, rp1):
         """
         Counterfactual regret minimization for Kuhn Poker
-        :param cards:   list[int] -
-        :param history: string    -
+        :param cards:   list[int] - card of each player
+        :param history: string    - plays so far
         :param rp0: float     - reach probability of player 0 (pi)
         :param rp1: float     - reach probability of player 1 (pi)
-        :return:
+        :return: float - utility of the player to act
         """
         plays = len(history)
         player = plays % 2
@@ -96,91 +141,101 @@ class KuhnTrainer:
             elif double_bet:
                 return 2 if is_player_card_higher else -2
 
-        info_set = str(cards[player]) + history
+        cell = self.info_set_index[cards[player]][history] * self.NUM_ACTIONS
 
-        # Get information set node or create it if nonexistant
-        if info_set not in self.node_map:
-            node = Node(info_set)
-            self.node_map[info_set] = node
-        else:
-            node = self.node_map[info_set]
-
-        # For each action, recursively call cfr with additional history and probability
+        # strategy[a] -> sigma^t (I, a), regret matched at the start of the iteration
+        strategy = self._flat_strategy[cell:cell + self.NUM_ACTIONS]
         reach_probability = rp0 if player == 0 else rp1
-        # strategy[i] -> sigma^t (I, a)
-        strategy = node.get_strategy(reach_probability)
-        util = [0.0] * self.NUM_ACTIONS
-        node_util = 0.0
-        for a in range(0, self.NUM_ACTIONS):
-            next_history = history + ('p' if a == 0 else 'b')
-            if player == 0:
-                util[a] = - self.cfr(cards, next_history, rp0*strategy[a], rp1)
-            else:
-                util[a] = - self.cfr(cards, next_history, rp0, rp1*strategy[a])
+        strategy_delta = self._flat_strategy_delta
+        strategy_delta[cell] += reach_probability * strategy[0]
+        strategy_delta[cell + 1] += reach_probability * strategy[1]
 
-            node_util += strategy[a] * util[a]
+        # For each action, recursively call cfr with additional history and probability
+        if player == 0:
+            util = [-self.cfr(cards, history + 'p', rp0 * strategy[0], rp1),
+                    -self.cfr(cards, history + 'b', rp0 * strategy[1], rp1)]
+        else:
+            util = [-self.cfr(cards, history + 'p', rp0, rp1 * strategy[0]),
+                    -self.cfr(cards, history + 'b', rp0, rp1 * strategy[1])]
+        node_util = strategy[0] * util[0] + strategy[1] * util[1]
 
         # For each action, compute and accumulate counterfactual regret
-        for a in range(0, self.NUM_ACTIONS):
-            regret = util[a] - node_util
-            node.regret_sum[a] += rp1 * regret if player == 0 else rp0 * regret
+        opponent_reach = rp1 if player == 0 else rp0
+        regret_delta = self._flat_regret_delta
+        regret_delta[cell] += opponent_reach * (util[0] - node_util)
+        regret_delta[cell + 1] += opponent_reach * (util[1] - node_util)
 
         return node_util
 
-    @staticmethod
-    def shuffle_cards(cards):
+    def shuffle_cards(self, cards):
         for c1 in range(len(cards) - 1, 0, -1):
-            c2 = random.randint(0, c1)
+            c2 = self.random.randint(0, c1)
             tmp = cards[c1]
             cards[c1] = cards[c2]
             cards[c2] = tmp
         return cards
 
-    def train(self, iterations):
+    def get_average_strategy(self, info_set):
         """
-        Train Kuhn Poker
-        :param iterations:
-        :return:
+        Get average information set mixed strategy across all training iterations
+        :param info_set: str - card followed by the history
+        :return: list[float]
         """
+        i = self.info_set_index[int(info_set[0])][info_set[1:]]
+        return average_strategy(self.strategy_sum[i]).tolist()
 
-        # index 0 will be card for player 1
-        # index 1 will be card for player 2
-        #cards = [1, 2, 3]
-        c1 = [2, 3, 1]  # Test Case
-        c2 = [2, 1, 3]  # Test Case
-        c3 = [2, 1, 3]
-        cards = [c1]
-        util = 0
-        for i in range(iterations):
-            #cards = self.shuffle_cards(cards)
-            #print(cards[i])
-            util += self.cfr(cards[i], '', 1, 1)
-
-        print('Average game value: {}'.format(util / iterations))
-        for info_set in sorted(self.node_map):
-            node = self.node_map[info_set]
-            avg_strat = node.get_average_strategy()
-            print('info_set is: {0} and average strategy for Pass: {1:.4f} Bet: {2:.4f}'.format(node.info_set, avg_strat[0], avg_strat[1]))
+    def train(self, iterations, verbose=True):
+        """
+        Train Kuhn Poker, further calls continue from where the last one stopped
+        :param iterations: int
+        :param verbose:    bool - print the game value and average strategies
+        :return: dict {str: list[float]} - average strategy of every info set
+        """
+        # Uniform chance scales every regret by the same amount, so only the game value is weighted by it
+        chance = 1.0 / len(DEALS)
+        cards = list(CARDS)
+        for _ in range(iterations):
+            regret_matching(self.regret_sum, out=self._strategy)
+            self._regret_delta.fill(0.0)
+            self._strategy_delta.fill(0.0)
+            if self.exhaustive:
+                for deal in DEALS:
+                    self.util += chance * self.cfr(deal, '', 1, 1)
+            else:
+                self.util += self.cfr(self.shuffle_cards(cards), '', 1, 1)
+            self.regret_sum += self._regret_delta
+            self.strategy_sum += self._strategy_delta
+        self.iteration += iterations
+
+        profile = {info_set: self.get_average_strategy(info_set) for info_set in INFO_SETS}
+        if verbose:
+            print('Average game value: {}'.format(self.util / self.iteration))
+            for info_set, avg_strat in profile.items():
+                print('info_set is: {0:3} and average strategy for Pass: {1:.4f} Bet: {2:.4f}'.format(
+                    info_set, avg_strat[0], avg_strat[1]))
+        return profile
 
 
 def main():
     iterations = 1000000
     KuhnTrainer().train(iterations)
 
-main()
+
+if __name__ == '__main__':
+    main()
 
 '''
-Average game value: -0.059024760010225504
-info_set is: 1   and average strategy for Pass: 0.8657 Bet: 0.1343
+Average game value: -0.0554358112404882
+info_set is: 1   and average strategy for Pass: 0.7923 Bet: 0.2077
 info_set is: 1b  and average strategy for Pass: 1.0000 Bet: 0.0000
-info_set is: 1p  and average strategy for Pass: 0.6663 Bet: 0.3337
+info_set is: 1p  and average strategy for Pass: 0.6673 Bet: 0.3327
 info_set is: 1pb and average strategy for Pass: 1.0000 Bet: 0.0000
 info_set is: 2   and average strategy for Pass: 1.0000 Bet: 0.0000
-info_set is: 2b  and average strategy for Pass: 0.6649 Bet: 0.3351
+info_set is: 2b  and average strategy for Pass: 0.6659 Bet: 0.3341
 info_set is: 2p  and average strategy for Pass: 1.0000 Bet: 0.0000
-info_set is: 2pb and average strategy for Pass: 0.5278 Bet: 0.4722
-info_set is: 3   and average strategy for Pass: 0.5881 Bet: 0.4119
+info_set is: 2pb and average strategy for Pass: 0.4584 Bet: 0.5416
+info_set is: 3   and average strategy for Pass: 0.3753 Bet: 0.6247
 info_set is: 3b  and average strategy for Pass: 0.0000 Bet: 1.0000
 info_set is: 3p  and average strategy for Pass: 0.0000 Bet: 1.0000
 info_set is: 3pb and average strategy for Pass: 0.0000 Bet: 1.0000
-'''
\ No newline at end of file
+'''
@@ -0,0 +1,199 @@
+import argparse
+import json
+import time
+from multiplayer import multiPlayerKuhnTrainer as mKuhnTrainer
+from multiplayer import multiPlayerKuhnPoker as mKuhnPoker
+from multiplayer import exploitability
+from multiplayer import kuhnHelper
+from multiplayer import main
+from multiplayer.kuhnGameTree import GAME_TREE
+
+# Work done by each benchmark of run_benchmarks, override any of them with the sizes argument
+DEFAULT_SIZES = {'cfr_iterations': 20000, 'br_iterations': 20000, 'hands': 200000, 'leaf_repeats': 2000,
+                 'main_iterations': 2000}
+
+
+def _uniform_profile():
+    # Info sets a short run has not visited yet are evaluated as uniform
+    return {name: [0.5, 0.5] for n in GAME_TREE.decision_nodes for name in GAME_TREE.info_set_names[n].values()}
+
+
+def sampling_convergence(seconds=10.0, evaluations=10, seed=0, sampling_modes=None):
+    """
+    Wall clock to exploitability curve of every KuhnTrainer sampling mode. Each trainer runs for `seconds` of training
+    time, split into equal slices, and the NashConv of its average strategy is computed exactly after every slice.
+    Evaluation time is not counted.
+    :param seconds:        float - training time per sampling mode
+    :param evaluations:    int   - number of points on each curve
+    :param seed:           int
+    :param sampling_modes: list[str] - defaults to KuhnTrainer.SAMPLING_MODES
+    :return: dict {str: list[(float, int, float)]} - (training seconds, iterations, NashConv) per sampling mode
+    """
+    curves = {}
+    for sampling in sampling_modes or mKuhnTrainer.KuhnTrainer.SAMPLING_MODES:
+        trainer = mKuhnTrainer.KuhnTrainer(seed=seed, sampling=sampling)
+        elapsed = 0.0
+        curve = []
+        for e in range(1, evaluations + 1):
+            start = time.perf_counter()
+            while elapsed + time.perf_counter() - start < seconds * e / evaluations:
+                trainer._run_iterations(100)
+            elapsed += time.perf_counter() - start
+
+            strategy_profile = {**_uniform_profile(), **trainer._average_strategy_profile()}
+            curve.append((elapsed, trainer.iteration, exploitability.nash_conv(strategy_profile)))
+        curves[sampling] = curve
+    return curves
+
+
+def print_curves(curves):
+    print('{:<10} {:>9} {:>11} {:>10}'.format('sampling', 'seconds', 'iterations', 'NashConv'))
+    for sampling, curve in curves.items():
+        for seconds, iterations, nash_conv in curve:
+            print('{:<10} {:>9.2f} {:>11} {:>10.5f}'.format(sampling, seconds, iterations, nash_conv))
+
+
+def _timed(name, work, unit, run):
+    """
+    :param name: str
+    :param work: int - units of work done by run
+    :param unit: str - what one unit of work is, the rate is reported per second
+    :param run:  callable
+    :return: dict - one benchmark result
+    """
+    start = time.perf_counter()
+    run()
+    seconds = time.perf_counter() - start
+    return {'name': name, 'work': work, 'unit': unit + '/s', 'seconds': seconds, 'rate': work / seconds}
+
+
+def bench_training(cfr_iterations, br_iterations, seed=0):
+    """
+    iterations/sec of KuhnTrainer.train for the strategy profile and for player 1's best response against it
+    :return: list[dict]
+    """
+    profile = {}
+
+    def train_cfr():
+        profile.update(mKuhnTrainer.KuhnTrainer(seed=seed).train(cfr_iterations))
+
+    def train_br():
+        mKuhnTrainer.KuhnTrainer(training_best_response=True, best_response_player=0,
+                                 strategy_profile={**_uniform_profile(), **profile}, seed=seed).train(br_iterations)
+
+    return [_timed('train_cfr', cfr_iterations, 'iterations', train_cfr),
+            _timed('train_br', br_iterations, 'iterations', train_br)]
+
+
+def bench_simulation(hands, seed=0):
+    """
+    hands/sec of KuhnPoker.play_poker, one hand at a time and batched
+    :return: list[dict]
+    """
+    profile = _uniform_profile()
+
+    def play(batched):
+        node_map = main.setup_kuhn_poker_game(profile, seed=seed)
+        game = mKuhnPoker.KuhnPoker(node_map)
+        return game.play_poker_batched(hands, seed=seed) if batched else game.play_poker(hands, seed=seed)
+
+    return [_timed('play_poker', hands, 'hands', lambda: play(False)),
+            _timed('play_poker_batched', hands, 'hands', lambda: play(True))]
+
+
+def bench_leaf_evaluation(repeats):
+    """
+    Terminal payoff lookups/sec, through kuhnHelper and straight from the compiled tree
+    :return: list[dict]
+    """
+    deals = GAME_TREE.deals.tolist()
+    leaves = [(GAME_TREE.histories[z], z, d) for z in GAME_TREE.terminal_nodes.tolist() for d in range(len(deals))]
+
+    def helper():
+        for _ in range(repeats):
+            for history, _, d in leaves:
+                kuhnHelper.calculate_terminal_payoff(history, deals[d])
+
+    def tree():
+        for _ in range(repeats):
+            for _, z, d in leaves:
+                GAME_TREE.terminal_payoff(z, d)
+
+    return [_timed('leaf_kuhn_helper', repeats * len(leaves), 'leaves', helper),
+            _timed('leaf_game_tree', repeats * len(leaves), 'leaves', tree)]
+
+
+def bench_main(iterations):
+    """
+    iterations/sec of a whole main.main run: training, best responses and evaluation, nothing persisted
+    :return: list[dict]
+    """
+    return [_timed('main', iterations, 'iterations', lambda: main.main(iterations=iterations))]
+
+
+def run_benchmarks(sizes=None, seed=0):
+    """
+    :param sizes: dict - overrides of DEFAULT_SIZES
+    :param seed:  int
+    :return: dict - sizes used and one result per benchmark
+    """
+    sizes = {**DEFAULT_SIZES, **(sizes or {})}
+    results = (bench_training(sizes['cfr_iterations'], sizes['br_iterations'], seed) +
+               bench_simulation(sizes['hands'], seed) + bench_leaf_evaluation(sizes['leaf_repeats']) +
+               bench_main(sizes['main_iterations']))
+    return {'sizes': sizes, 'results': results}
+
+
+def compare_to_baseline(report, baseline, tolerance=0.2):
+    """
+    Benchmarks whose rate dropped more than tolerance below the baseline. Results missing from either side are skipped
+    :param report:    dict - run_benchmarks output
+    :param baseline:  dict - an earlier run_benchmarks output
+    :param tolerance: float - allowed relative slowdown
+    :return: list[dict] - name, baseline rate, rate and relative change of every regression
+    """
+    baseline_rates = {r['name']: r['rate'] for r in baseline['results']}
+    regressions = []
+    for result in report['results']:
+        base = baseline_rates.get(result['name'])
+        if base and result['rate'] < base * (1 - tolerance):
+            regressions.append({'name': result['name'], 'baseline': base, 'rate': result['rate'],
+                                'change': result['rate'] / base - 1})
+    return regressions
+
+
+def print_report(report):
+    print('{:<20} {:>12} {:>10} {:>14}'.format('benchmark', 'work', 'seconds', 'rate'))
+    for r in report['results']:
+        print('{:<20} {:>12} {:>10.3f} {:>14.1f} {}'.format(r['name'], r['work'], r['seconds'], r['rate'], r['unit']))
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description='Time the training, simulation and evaluation hot paths')
+    for name, value in DEFAULT_SIZES.items():
+        parser.add_argument('--' + name.replace('_', '-'), type=int, default=value)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the report as JSON to this file')
+    parser.add_argument('--baseline', help='JSON report of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative slowdown against the baseline')
+    parser.add_argument('--convergence', action='store_true', help='print sampling mode convergence curves instead')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = _parse_args()
+    if args.convergence:
+        print_curves(sampling_convergence(seed=args.seed))
+    else:
+        report = run_benchmarks({name: getattr(args, name) for name in DEFAULT_SIZES}, args.seed)
+        print_report(report)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(report, f, indent=2)
+        if args.baseline:
+            with open(args.baseline) as f:
+                regressions = compare_to_baseline(report, json.load(f), args.tolerance)
+            for r in regressions:
+                print('REGRESSION {name}: {rate:.1f} vs baseline {baseline:.1f} ({change:+.1%})'.format(**r))
+            if regressions:
+                raise SystemExit(1)
@@ -0,0 +1,97 @@
+import numpy as np
+from multiplayer.kuhnGameTree import GAME_TREE, ACTIONS
+
+
+def compute_best_response(strategy_profile, player, tree=GAME_TREE):
+    """
+    Exact best response of one player against a fixed strategy profile of the opponents.
+
+    The player's decisions are made bottom up, one of the player's tree levels at a time. At each of the player's
+    nodes the opponent-reach weighted action values are summed over every deal in the info set, and the best action
+    is played for all of them. Deeper decisions are already fixed, so values below a node are those of the best
+    response.
+
+    :param strategy_profile: dict {str: list[float]} - must contain the opponents' info sets
+    :param player:           int - 0 .. tree.num_players - 1
+    :return: dict {str: list[float]} - pure strategy for every info set of the player, same format as KuhnTrainer
+    """
+    return best_response_values(tree.strategy_matrix(strategy_profile), player, tree)[0]
+
+
+def compute_best_responses(strategy_profile, tree=GAME_TREE):
+    """
+    compute_best_response for every player, sharing one lookup of the profile
+    :param strategy_profile: dict {str: list[float]}
+    :return: list[dict] - in player order
+    """
+    matrix = tree.strategy_matrix(strategy_profile)
+    return [best_response_values(matrix, player, tree)[0] for player in range(tree.num_players)]
+
+
+def player_values(strategy, payoffs, player, tree=GAME_TREE, stop_depth=0):
+    """
+    Backward pass of one player's expected utility, one tree level at a time for every deal of a chunk at once
+    :param strategy:   np.array (deals, nodes, actions) - see KuhnGameTree.strategy_table
+    :param payoffs:    np.array (terminals, deals, players) - see KuhnGameTree.deal_payoffs
+    :param player:     int
+    :param stop_depth: int - decision nodes above this depth are left at 0
+    :return: np.array (deals, nodes)
+    """
+    values = np.zeros((len(strategy), tree.num_nodes))
+    values[:, tree.terminal_nodes] = payoffs[:, :, player].T
+    for nodes in tree.decision_levels[stop_depth:][::-1]:
+        values[:, nodes] = (strategy[:, nodes] * values[:, tree.children[nodes]]).sum(axis=2)
+    return values
+
+
+def best_response_values(matrix, player, tree=GAME_TREE):
+    """
+    :param matrix: np.array (info sets, actions) - see KuhnGameTree.strategy_matrix
+    :param player: int
+    :return: (dict, float) - best response, and its expected utility against the rest of the profile
+    """
+    num_cards = len(tree.cards)
+    num_actions = len(ACTIONS)
+    # The player's rows are replaced by the best response as its decisions are made, opponents' rows stay the same
+    matrix = matrix.copy()
+
+    best_response = {}
+    value = 0.0
+    for depth in range(len(tree.decision_levels) - 1, -1, -1):
+        nodes = tree.decision_levels[depth]
+        own = nodes[tree.player[nodes] == player]
+        if not len(own):
+            continue
+
+        # Counterfactual value of every action summed over the deals sharing each card, chunk by chunk. Terminals
+        # above the level only count for the shallowest level, where they complete the value of the root
+        slots = len(own) * num_actions
+        action_values = np.zeros(num_cards * slots)
+        above = tree.terminal_nodes[tree.depth[tree.terminal_nodes] < depth]
+        above_value = 0.0
+        for deals in tree.deal_chunks():
+            strategy = tree.strategy_table(matrix, deals)
+            payoffs = tree.deal_payoffs(deals)
+            # Probability that the opponents play to each node, the best responder's own actions are left out
+            opponent_reach = tree.opponent_reach(strategy, player, depth)
+            values = player_values(strategy, payoffs, player, tree, stop_depth=depth + 1)
+            cards = tree.deals[deals, player] - tree.cards[0]
+            index = cards[:, None] * slots + np.arange(slots)
+            weights = opponent_reach[:, own, None] * values[:, tree.children[own]]
+            action_values += np.bincount(index.ravel(), weights=weights.ravel(), minlength=num_cards * slots)
+            above_value += (opponent_reach[:, above] * payoffs[tree.terminal_id[above], :, player].T).sum()
+
+        action_values = action_values.reshape(num_cards, len(own), num_actions)
+        best_actions = action_values.argmax(axis=2)
+        # Nothing the player does happens above its shallowest level, which is the last one decided
+        value = action_values.max(axis=2).sum() + above_value
+        rows = tree.card_info_set_rows[tree.decision_index[own]].T
+        matrix[rows] = np.eye(num_actions)[best_actions]
+        for k, n in enumerate(own):
+            for c, info_set in enumerate(tree.info_set_names[n].values()):
+                pure_strategy = [0.0] * num_actions
+                pure_strategy[best_actions[c, k]] = 1.0
+                best_response[info_set] = pure_strategy
+
+    best_response = {info_set: best_response[info_set] for info_set in sorted(best_response)}
+    return best_response, float(value / len(tree.deals))
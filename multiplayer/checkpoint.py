@@ -0,0 +1,108 @@
+import os
+import threading
+import numpy as np
+
+
+def save_checkpoint(path, info_sets, regret_sum, strategy_sum, iteration, util, rng_state, deck):
+    """
+    Write the raw training tables to an uncompressed .npz file. The file is written next to path and renamed over it,
+    so an interrupted write never replaces the last good checkpoint
+    :param path:         str
+    :param info_sets:    list[str] - row order of the tables
+    :param regret_sum:   np.array (info sets, actions)
+    :param strategy_sum: np.array (info sets, actions)
+    :param iteration:    int - iterations completed
+    :param util:         np.array - summed root utilities so far
+    :param rng_state:    tuple - state of the deal shuffling generator, from random.getstate()
+    :param deck:         list[int] - card order, the next deal shuffles it in place
+    """
+    version, internal_state, gauss_next = rng_state
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, info_sets=np.array(info_sets, dtype=str), regret_sum=regret_sum, strategy_sum=strategy_sum,
+                 iteration=iteration, util=util, rng_version=version,
+                 rng_state=np.array(internal_state, dtype=np.uint64),
+                 rng_gauss=np.nan if gauss_next is None else gauss_next, deck=deck)
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path):
+    """
+    :param path: str
+    :return: dict - same fields as save_checkpoint
+    """
+    with np.load(path) as data:
+        gauss_next = float(data['rng_gauss'])
+        return {'info_sets': data['info_sets'].tolist(),
+                'regret_sum': data['regret_sum'],
+                'strategy_sum': data['strategy_sum'],
+                'iteration': int(data['iteration']),
+                'util': data['util'],
+                'rng_state': (int(data['rng_version']), tuple(data['rng_state'].tolist()),
+                              None if np.isnan(gauss_next) else gauss_next),
+                'deck': data['deck'].tolist()}
+
+
+class CheckpointWriter:
+    """
+    Writes checkpoints on a background thread. submit() only copies the tables, the training loop never waits on disk.
+    If a write is still running when the next checkpoint is submitted, the older pending one is dropped. A failed write
+    is raised again by the next submit() or by close()
+    """
+
+    def __init__(self, path, every):
+        self.path = path
+        self.every = every
+        self._pending = None
+        self._closed = False
+        self._error = None
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._write_loop, daemon=True)
+        self._thread.start()
+
+    def submit(self, iteration, store, util, rng, deck):
+        """
+        Snapshot the trainer state when iteration is a multiple of every
+        :param iteration: int - iterations completed
+        :param store:     InfoSetStore
+        :param util:      np.array - summed root utilities so far
+        :param rng:       random.Random or the random module
+        :param deck:      list[int]
+        """
+        self._raise_error()
+        if iteration % self.every:
+            return
+        rows = len(store)
+        snapshot = (list(store.info_sets), store.regret_sum[:rows].copy(), store.strategy_sum[:rows].copy(),
+                    iteration, np.array(util, dtype=float), rng.getstate(), list(deck))
+        with self._condition:
+            self._pending = snapshot
+            self._condition.notify()
+
+    def _write_loop(self):
+        while True:
+            with self._condition:
+                while self._pending is None and not self._closed:
+                    self._condition.wait()
+                if self._pending is None:
+                    return
+                snapshot, self._pending = self._pending, None
+            try:
+                save_checkpoint(self.path, *snapshot)
+            except Exception as error:
+                with self._condition:
+                    self._error = error
+
+    def _raise_error(self):
+        with self._condition:
+            error, self._error = self._error, None
+        if error is not None:
+            raise error
+
+    def close(self):
+        # Wait for the last submitted checkpoint to reach disk
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+        self._raise_error()
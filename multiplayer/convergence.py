@@ -0,0 +1,79 @@
+import numpy as np
+from multiplayer import exploitability
+from multiplayer.bestResponse import compute_best_response
+
+METRICS = ['exploitability', 'strategy_change']
+
+
+class ConvergenceMonitor:
+    """
+    Early stopping for KuhnTrainer.train. Every `every` iterations the trainer's average strategy is measured and the
+    value appended to curve as (iteration, value). Training stops once the value is at or below target, or once it
+    improved by less than plateau for `patience` checks in a row.
+
+    Metrics:
+        exploitability  - NashConv of the average strategy profile, computed exactly. For a best response trainer,
+                          what an exact best response still gains over the trained strategy against the fixed profile
+        strategy_change - largest change of any info set's average strategy since the previous check, much cheaper
+                          on large games
+    Info sets a trainer has not visited yet are measured as uniform.
+    """
+
+    def __init__(self, every=1000, target=None, plateau=None, patience=3, metric='exploitability'):
+        if metric not in METRICS:
+            raise ValueError('Unknown convergence metric {}, expected one of {}'.format(metric, METRICS))
+        self.every = every
+        self.target = target
+        self.plateau = plateau
+        self.patience = patience
+        self.metric = metric
+        self.curve = []
+        self.stopped_at = None
+        self._previous_profile = None
+        self._stalled = 0
+
+    def _profile(self, trainer):
+        tree = trainer.tree
+        uniform = {name: [0.5, 0.5] for n in tree.decision_nodes for name in tree.info_set_names[n].values()}
+        return {**uniform, **trainer._average_strategy_profile()}
+
+    def _exploitability(self, trainer, profile):
+        tree = trainer.tree
+        if not trainer.training_best_response:
+            return exploitability.nash_conv(profile, tree=tree)
+
+        player = trainer.best_response_player
+        fixed = {**profile, **trainer.strategy_profile}
+        trained = {**fixed, **trainer.game.positions(profile)[player]}
+        best_response = compute_best_response(fixed, player, tree)
+        return float(exploitability.expected_utilities({**fixed, **best_response}, tree)[player] -
+                     exploitability.expected_utilities(trained, tree)[player])
+
+    def _strategy_change(self, profile):
+        previous, self._previous_profile = self._previous_profile, profile
+        if previous is None:
+            return np.inf
+        return max(float(np.abs(np.subtract(profile[i], previous[i])).max()) for i in profile)
+
+    def check(self, trainer):
+        """
+        Measure the trainer and decide whether to stop
+        :param trainer: KuhnTrainer
+        :return: bool - True when training should stop
+        """
+        profile = self._profile(trainer)
+        if self.metric == 'exploitability':
+            value = self._exploitability(trainer, profile)
+        else:
+            value = self._strategy_change(profile)
+
+        if self.curve and self.plateau is not None and self.curve[-1][1] - value < self.plateau:
+            self._stalled += 1
+        else:
+            self._stalled = 0
+        self.curve.append((trainer.iteration, value))
+
+        if (self.target is not None and value <= self.target) or self._stalled >= self.patience:
+            self.stopped_at = trainer.iteration
+            return True
+        return False
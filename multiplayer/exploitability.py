@@ -0,0 +1,110 @@
+import numpy as np
+from multiplayer.kuhnGameTree import GAME_TREE
+from multiplayer.bestResponse import best_response_values
+
+
+def _node_values(strategy, payoffs, tree=GAME_TREE):
+    """
+    Expected utility of every player below every node
+    :param strategy: np.array (deals, nodes, actions) - see KuhnGameTree.strategy_table
+    :param payoffs:  np.array (terminals, deals, players) - see KuhnGameTree.deal_payoffs
+    :return: np.array (deals, nodes, players)
+    """
+    values = np.zeros((len(strategy), tree.num_nodes, tree.num_players))
+    values[:, tree.terminal_nodes] = payoffs.transpose(1, 0, 2)
+    for nodes in tree.decision_levels[::-1]:
+        values[:, nodes] = (strategy[:, nodes, :, None] * values[:, tree.children[nodes]]).sum(axis=2)
+    return values
+
+
+def _terminal_utilities(reach, payoffs, tree, player=None):
+    """
+    :param reach:   np.array (deals, nodes) - probability of reaching every node
+    :param payoffs: np.array (terminals, deals, players) - see KuhnGameTree.deal_payoffs
+    :return: np.array - expected utility of every player, or of one player, summed over the deals
+    """
+    terminal_reach = reach[:, tree.terminal_nodes]
+    if player is None:
+        return np.einsum('dt,tdp->p', terminal_reach, payoffs)
+    return float(np.einsum('dt,td->', terminal_reach, payoffs[:, :, player]))
+
+
+def expected_utilities(strategy_profile, tree=GAME_TREE):
+    """
+    Exact expected utility of each player: every deal is enumerated and terminal payoffs are weighted by the
+    probability of reaching them
+    :param strategy_profile: dict {str: list[float]} - must cover every info set
+    :return: np.array - utility for players 1, 2, 3, ...
+    """
+    matrix = tree.strategy_matrix(strategy_profile)
+    utilities = np.zeros(tree.num_players)
+    for deals in tree.deal_chunks():
+        reach = tree.reach_probabilities(tree.strategy_table(matrix, deals)).prod(axis=2)
+        utilities += _terminal_utilities(reach, tree.deal_payoffs(deals), tree)
+    return utilities / len(tree.deals)
+
+
+def info_set_utilities(strategy_profile, tree=GAME_TREE):
+    """
+    Exact counterpart of simulating hands and counting plays and utility per info set
+    :param strategy_profile: dict {str: list[float]} - must cover every info set
+    :return: dict {str: (float, float)} - per info set, the probability a hand reaches it and the expected utility of
+             the acting player over hands that reach it (zero elsewhere)
+    """
+    matrix = tree.strategy_matrix(strategy_profile)
+    nodes = tree.decision_nodes
+    plays = np.zeros(len(tree.info_sets))
+    utility = np.zeros(len(tree.info_sets))
+    # Position of the first (deal, node) playing each info set, in a walk over deals, then nodes
+    first = np.full(len(tree.info_sets), np.iinfo(np.int64).max)
+    for deals in tree.deal_chunks():
+        strategy = tree.strategy_table(matrix, deals)
+        reach = tree.reach_probabilities(strategy).prod(axis=2)[:, nodes] / len(tree.deals)
+        values = _node_values(strategy, tree.deal_payoffs(deals), tree)[:, nodes, tree.player[nodes]]
+
+        rows = tree.deal_info_set_rows(deals).ravel()
+        plays += np.bincount(rows, weights=reach.ravel(), minlength=len(tree.info_sets))
+        utility += np.bincount(rows, weights=(reach * values).ravel(), minlength=len(tree.info_sets))
+        seen, position = np.unique(rows, return_index=True)
+        first[seen] = np.minimum(first[seen], position + deals.start * len(nodes))
+
+    order = np.argsort(first[first < np.iinfo(np.int64).max])
+    played = np.flatnonzero(first < np.iinfo(np.int64).max)[order]
+    return {tree.info_sets[i]: (plays[i], utility[i]) for i in played}
+
+
+def best_response_gains(strategy_profile, best_responses=None, tree=GAME_TREE):
+    """
+    Utility of each player under the profile, and when that player alone switches to its best response. The profile
+    is looked up once and shared by every player's evaluation
+    :param strategy_profile: dict {str: list[float]}
+    :param best_responses: list[dict] - one per player, computed exactly when not provided
+    :return: (np.array, np.array) - profile utilities and best response utilities for players 1, 2, 3, ...
+    """
+    matrix = tree.strategy_matrix(strategy_profile)
+    if best_responses is None:
+        br_utilities = np.array([best_response_values(matrix, player, tree)[1] for player in range(tree.num_players)])
+        return expected_utilities(strategy_profile, tree), br_utilities
+
+    br_matrices = [tree.strategy_matrix({**strategy_profile, **br}) for br in best_responses]
+    profile_utilities = np.zeros(tree.num_players)
+    br_utilities = np.zeros(tree.num_players)
+    for deals in tree.deal_chunks():
+        payoffs = tree.deal_payoffs(deals)
+        reach = tree.reach_probabilities(tree.strategy_table(matrix, deals))
+        profile_utilities += _terminal_utilities(reach.prod(axis=2), payoffs, tree)
+        for player, br_matrix in enumerate(br_matrices):
+            # Only the player's own reach changes when it switches to its best response
+            br_reach = tree.player_reach(tree.strategy_table(br_matrix, deals), player)
+            opponent_reach = np.delete(reach, player, axis=2).prod(axis=2)
+            br_utilities[player] += _terminal_utilities(opponent_reach * br_reach, payoffs, tree, player)
+    return profile_utilities / len(tree.deals), br_utilities / len(tree.deals)
+
+
+def nash_conv(strategy_profile, best_responses=None, tree=GAME_TREE):
+    """
+    Sum over players of what a unilateral best response gains, 0 exactly at a Nash Equilibrium
+    :return: float
+    """
+    profile_utilities, br_utilities = best_response_gains(strategy_profile, best_responses, tree)
+    return float((br_utilities - profile_utilities).sum())
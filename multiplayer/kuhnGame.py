@@ -0,0 +1,107 @@
+from string import digits
+
+ACTIONS = ['p', 'b']
+
+
+class KuhnGame:
+    """
+    Kuhn Poker rules for any number of players and deck size.
+
+    Every player antes and is dealt one card from a deck numbered 1..num_cards. Players act once each in turn: while
+    nobody has bet they may pass (p) or bet (b), after the first bet every other player in turn folds (p) or calls (b).
+    The game ends when everyone has passed, or when the action gets back around to the first bettor. The highest card
+    among the contenders (everyone who bet or called, or everyone if nobody bet) wins the pot.
+
+    An info set is the player's card followed by the betting history, e.g. '10pb'. Histories only contain p and b,
+    so the card and the acting player can always be read back from it.
+    """
+
+    def __init__(self, num_players=3, num_cards=4, ante=1, bet=1):
+        if num_players < 2 or num_cards < num_players:
+            raise ValueError('Kuhn Poker needs at least 2 players and a card for every player')
+        self.num_players = num_players
+        self.num_cards = num_cards
+        self.ante = ante
+        self.bet = bet
+        self.cards = list(range(1, num_cards + 1))
+
+    def params(self):
+        return self.num_players, self.num_cards, self.ante, self.bet
+
+    def is_terminal(self, history):
+        """
+        :param history: str - sequence of plays that describe game state
+        :return: bool
+        """
+        if 'b' not in history:
+            return len(history) == self.num_players
+        return len(history) == history.index('b') + self.num_players
+
+    def is_decision(self, history):
+        """
+        :param history: str
+        :return: bool - history can be reached and a player still has to act after it
+        """
+        if set(history) - set(ACTIONS):
+            return False
+        return not any(self.is_terminal(history[:i]) for i in range(len(history) + 1))
+
+    def player(self, history):
+        """
+        :param history: str
+        :return: int - player to act after history
+        """
+        return len(history) % self.num_players
+
+    def info_set_player(self, info_set):
+        """
+        :param info_set: str - card followed by history
+        :return: int - player the info set belongs to
+        """
+        return self.player(info_set.lstrip(digits))
+
+    def contributions(self, history):
+        """
+        :param history: str - terminal history
+        :return: list[int] - chips each player put in the pot
+        """
+        contributions = [self.ante] * self.num_players
+        for i, action in enumerate(history):
+            if action == 'b':
+                contributions[i % self.num_players] += self.bet
+        return contributions
+
+    def contenders(self, history):
+        """
+        :param history: str - terminal history
+        :return: list[int] - players still in the hand at showdown
+        """
+        bettors = sorted({i % self.num_players for i, action in enumerate(history) if action == 'b'})
+        return bettors or list(range(self.num_players))
+
+    def terminal_payoff(self, history, cards):
+        """
+        :param history: str       - terminal history
+        :param cards:   list[int] - card of every player
+        :return:        list[int] - utility of every player
+        """
+        contributions = self.contributions(history)
+        winner = max(self.contenders(history), key=lambda p: cards[p])
+        util = [-c for c in contributions]
+        util[winner] += sum(contributions)
+        return util
+
+    def positions(self, strategy_profile):
+        """
+        Split a strategy profile into the info sets of each player
+        :param strategy_profile: dict {str: list[float]}
+        :return: list[dict] - one profile per player
+        """
+        positions = [{} for _ in range(self.num_players)]
+        for info_set, strategy in strategy_profile.items():
+            positions[self.info_set_player(info_set)][info_set] = strategy
+        return positions
+
+
+# Three players and four cards, the game the rest of the package was written for
+DEFAULT_GAME = KuhnGame()
@@ -0,0 +1,306 @@
+from functools import lru_cache
+from itertools import permutations
+import numpy as np
+from multiplayer.kuhnGame import KuhnGame, ACTIONS
+
+# Defaults of the three player, four card game
+CARDS = [1, 2, 3, 4]
+NUM_PLAYERS = 3
+# Exact sweeps over every deal work through chunks of deals, sized so one (deals, nodes, players) float array of a
+# chunk stays under this many bytes
+CHUNK_BYTES = 32 * 2 ** 20
+
+
+class KuhnGameTree:
+    """
+    A KuhnGame compiled into integer tables. Every betting history is enumerated once (breadth first, so a parent
+    always has a smaller id than its children) and the string rules of the game are only evaluated here.
+
+    Tables indexed by node id:
+        histories[n]   str  - betting history of the node
+        children[n, a] int  - node reached by taking action a (-1 for terminal nodes)
+        parent[n]      int  - node the history came from (-1 for the root)
+        action[n]      int  - action taken at the parent to reach the node (-1 for the root)
+        terminal[n]    bool - is the game over
+        player[n]      int  - player to act
+        depth[n]       int  - number of actions taken
+        terminal_id[n] int  - row of the node in payoffs (-1 for decision nodes)
+
+    Deal tables:
+        deals[d]            - card of every player for each ordered deal of num_players cards from the deck
+        contributions[t, p] - chips player p put in the pot at terminal t
+        contenders[t, p]    - is player p in the showdown at terminal t
+        rankings[r]         - players ordered from the highest card down, one row per permutation of the players
+        deal_ranking[d]     - row of rankings that deal d produces
+        ranked_payoffs[t, r, p] - utility of player p at terminal t when the cards are ranked as rankings[r]
+        payoffs[t, d, p]    - utility of player p at terminal t for deal d, built on first use since it grows with
+                              terminals * deals * players. deal_payoffs builds it for a chunk of deals
+
+    Info set tables:
+        info_sets[i]        - every info set of the game, sorted
+        card_info_set_rows[k, c] - row of info_sets played at decision_nodes[k] by the holder of cards[c]
+        info_set_rows[d, k] - row of info_sets played at decision_nodes[k] under deal d, built on first use.
+                              deal_info_set_rows builds it for a chunk of deals
+        levels[k]           - nodes at depth k + 1, decision_levels[k] the decision nodes at depth k. Sweeps over the
+                              tree handle one level at a time for every deal of a chunk at once
+
+    Exact evaluation never holds (deals, nodes) arrays for the whole game, it walks deal_chunks() instead. chunk_size
+    deals keep each (deals, nodes, players) array under CHUNK_BYTES.
+
+    The winner of a showdown only depends on which contender ranks highest, so payoffs are computed once per
+    (terminal, ranking) and every deal is mapped to its ranking. There are num_players! rankings against
+    num_cards! / (num_cards - num_players)! deals.
+    """
+    ROOT = 0
+
+    def __init__(self, game=None):
+        self.game = game if game is not None else KuhnGame()
+        self.num_players = self.game.num_players
+        self.cards = self.game.cards
+
+        histories = ['']
+        parent = [-1]
+        terminal = []
+        i = 0
+        while i < len(histories):
+            history = histories[i]
+            terminal.append(self.game.is_terminal(history))
+            if not terminal[i]:
+                histories.extend([history + a for a in ACTIONS])
+                parent.extend([i] * len(ACTIONS))
+            i += 1
+
+        self.histories = histories
+        self.node_ids = {h: n for n, h in enumerate(histories)}
+        self.num_nodes = len(histories)
+        self.parent = np.array(parent)
+        self.terminal = np.array(terminal)
+        self.depth = np.array([len(h) for h in histories])
+        self.player = self.depth % self.num_players
+        self.action = np.array([-1] + [ACTIONS.index(h[-1]) for h in histories[1:]])
+        self.children = np.array([[-1] * len(ACTIONS) if terminal[n] else [self.node_ids[h + a] for a in ACTIONS]
+                                  for n, h in enumerate(histories)])
+        self.decision_nodes = np.flatnonzero(~self.terminal)
+        self.terminal_nodes = np.flatnonzero(self.terminal)
+        self.terminal_id = np.full(self.num_nodes, -1)
+        self.terminal_id[self.terminal_nodes] = np.arange(len(self.terminal_nodes))
+
+        self.deals = np.array(list(permutations(self.cards, self.num_players)))
+        self.deal_ids = {tuple(deal): d for d, deal in enumerate(self.deals.tolist())}
+        self.contributions = np.array([self.game.contributions(histories[z]) for z in self.terminal_nodes])
+        self.contenders = np.zeros((len(self.terminal_nodes), self.num_players), dtype=bool)
+        for t, z in enumerate(self.terminal_nodes):
+            self.contenders[t, self.game.contenders(histories[z])] = True
+
+        self.rankings = np.array(list(permutations(range(self.num_players))))
+        ranking_ids = {tuple(ranking): r for r, ranking in enumerate(self.rankings.tolist())}
+        deal_order = np.argsort(-self.deals, axis=1)
+        self.deal_ranking = np.array([ranking_ids[tuple(order)] for order in deal_order.tolist()])
+        self.ranked_payoffs = self._ranked_payoffs_table()
+        self._payoff_table = None
+
+        # info_set_names[n][card] - info set key (card + history) of the player acting at decision node n
+        self.info_set_names = [{c: str(c) + h for c in self.cards} for h in histories]
+        self.info_sets = sorted(name for n in self.decision_nodes for name in self.info_set_names[n].values())
+        info_set_ids = {info_set: i for i, info_set in enumerate(self.info_sets)}
+        self.card_info_set_rows = np.array([[info_set_ids[self.info_set_names[n][c]] for c in self.cards]
+                                             for n in self.decision_nodes]).reshape(-1, len(self.cards))
+        self._info_set_rows = None
+
+        self.levels = [np.flatnonzero(self.depth == k) for k in range(1, self.depth.max() + 1)]
+        # Position of each decision node in decision_nodes (-1 for terminal nodes)
+        self.decision_index = np.full(self.num_nodes, -1)
+        self.decision_index[self.decision_nodes] = np.arange(len(self.decision_nodes))
+        self.chunk_size = max(CHUNK_BYTES // (8 * self.num_nodes * max(self.num_players, len(ACTIONS))), 1)
+        decision_depth = self.depth[self.decision_nodes]
+        self.decision_levels = [self.decision_nodes[decision_depth == k] for k in range(self.depth.max())]
+
+        # Plain list copies for the scalar accessors below. Indexing NumPy arrays one element at a time is slower than
+        # indexing lists, and the recursive trainer and simulator look up a handful of entries per node visit
+        self._terminal = self.terminal.tolist()
+        self._player = self.player.tolist()
+        self._children = self.children.tolist()
+        self._deals = self.deals.tolist()
+        self._deal_ranking = self.deal_ranking.tolist()
+        self._ranked_payoffs = [self.ranked_payoffs[self.terminal_id[n]].tolist() if terminal[n] else None
+                                for n in range(self.num_nodes)]
+
+    def __reduce__(self):
+        # Trees are rebuilt (once per process, see game_tree) from the game parameters instead of pickling the tables
+        return game_tree, self.game.params()
+
+    def _ranked_payoffs_table(self):
+        """
+        :return: np.array (terminals, rankings, players)
+        """
+        # The winner is the first contender in the ranking
+        in_showdown = self.contenders[:, self.rankings]
+        winner = self.rankings[np.arange(len(self.rankings))[None, :], in_showdown.argmax(axis=2)]
+        payoffs = np.repeat(-self.contributions[:, None, :].astype(float), len(self.rankings), axis=1)
+        terminal, ranking = np.indices(winner.shape)
+        payoffs[terminal, ranking, winner] += self.contributions.sum(axis=1)[:, None]
+        return payoffs
+
+    @property
+    def payoffs(self):
+        """
+        :return: np.array (terminals, deals, players)
+        """
+        if self._payoff_table is None:
+            self._payoff_table = self.deal_payoffs()
+        return self._payoff_table
+
+    def deal_payoffs(self, deals=slice(None)):
+        """
+        :param deals: slice or np.array - deal ids
+        :return: np.array (terminals, deals, players)
+        """
+        return self.ranked_payoffs[:, self.deal_ranking[deals]]
+
+    @property
+    def info_set_rows(self):
+        """
+        :return: np.array (deals, decision nodes)
+        """
+        if self._info_set_rows is None:
+            self._info_set_rows = self.deal_info_set_rows()
+        return self._info_set_rows
+
+    def deal_info_set_rows(self, deals=slice(None)):
+        """
+        :param deals: slice or np.array - deal ids
+        :return: np.array (deals, decision nodes) - row of info_sets played at each decision node
+        """
+        cards = self.deals[deals][:, self.player[self.decision_nodes]] - self.cards[0]
+        return self.card_info_set_rows[np.arange(len(self.decision_nodes)), cards]
+
+    def deal_chunks(self):
+        """
+        :return: list[slice] - consecutive chunks of at most chunk_size deals, covering every deal
+        """
+        return [slice(start, min(start + self.chunk_size, len(self.deals)))
+                for start in range(0, len(self.deals), self.chunk_size)]
+
+    def deal_id(self, cards):
+        """
+        :param cards: list[int] - shuffled deck, the first num_players cards go to players 1, 2, ...
+        :return: int
+        """
+        return self.deal_ids[tuple(cards[:self.num_players])]
+
+    def is_terminal(self, node):
+        return self._terminal[node]
+
+    def player_to_act(self, node):
+        return self._player[node]
+
+    def child(self, node, action):
+        """
+        :param node:   int
+        :param action: int - index into ACTIONS
+        :return: int
+        """
+        return self._children[node][action]
+
+    def info_set(self, node, deal):
+        """
+        Info set key of the player acting at node for a given deal
+        :param node: int
+        :param deal: int
+        :return: str
+        """
+        return self.info_set_names[node][self._deals[deal][self._player[node]]]
+
+    def terminal_payoff(self, node, deal):
+        """
+        :param node: int - terminal node id
+        :param deal: int
+        :return: list[float] - utility for players 1, 2, 3, ...
+        """
+        return self._ranked_payoffs[node][self._deal_ranking[deal]]
+
+    def strategy_matrix(self, strategy_profile):
+        """
+        :param strategy_profile: dict {str: list[float]}
+        :return: np.array (info sets, actions) - row i is the strategy of info_sets[i], zeros where it is missing
+        """
+        matrix = np.zeros((len(self.info_sets), len(ACTIONS)))
+        for i, info_set in enumerate(self.info_sets):
+            if info_set in strategy_profile:
+                matrix[i] = strategy_profile[info_set]
+        return matrix
+
+    def strategy_table(self, strategy_profile, deals=slice(None)):
+        """
+        Look up a strategy profile once for every (deal, node)
+        :param strategy_profile: dict {str: list[float]}, or its strategy_matrix
+        :param deals:            slice or np.array - deal ids, every deal by default
+        :return: np.array (deals, nodes, actions), zeros at terminal nodes and at info sets missing from the profile
+        """
+        matrix = strategy_profile
+        if not isinstance(matrix, np.ndarray):
+            matrix = self.strategy_matrix(strategy_profile)
+        rows = self.deal_info_set_rows(deals)
+        strategy = np.zeros((len(rows), self.num_nodes, len(ACTIONS)))
+        strategy[:, self.decision_nodes] = matrix[rows]
+        return strategy
+
+    def reach_probabilities(self, strategy):
+        """
+        Probability that each player's own actions lead to every node
+        :param strategy: np.array (deals, nodes, actions) - see strategy_table
+        :return: np.array (deals, nodes, players)
+        """
+        reach = np.ones((len(strategy), self.num_nodes, self.num_players))
+        for nodes in self.levels:
+            parents = self.parent[nodes]
+            reach[:, nodes] = reach[:, parents]
+            reach[:, nodes, self.player[parents]] *= strategy[:, parents, self.action[nodes]]
+        return reach
+
+    def opponent_reach(self, strategy, player, depth=None):
+        """
+        Product of every column of reach_probabilities but the player's, without computing them one by one
+        :param strategy: np.array (deals, nodes, actions) - see strategy_table
+        :param player:   int
+        :param depth:    int - only nodes down to this depth are filled in, all of them when None
+        :return: np.array (deals, nodes)
+        """
+        reach = np.ones((len(strategy), self.num_nodes))
+        for nodes in self.levels[:depth]:
+            parents = self.parent[nodes]
+            reach[:, nodes] = reach[:, parents]
+            other = self.player[parents] != player
+            reach[:, nodes[other]] *= strategy[:, parents[other], self.action[nodes[other]]]
+        return reach
+
+    def player_reach(self, strategy, player):
+        """
+        Column player of reach_probabilities, without computing the others
+        :param strategy: np.array (deals, nodes, actions) - see strategy_table
+        :param player:   int
+        :return: np.array (deals, nodes)
+        """
+        reach = np.ones((len(strategy), self.num_nodes))
+        for nodes in self.levels:
+            parents = self.parent[nodes]
+            reach[:, nodes] = reach[:, parents]
+            own = self.player[parents] == player
+            reach[:, nodes[own]] *= strategy[:, parents[own], self.action[nodes[own]]]
+        return reach
+
+
+@lru_cache(maxsize=None)
+def _compiled_tree(num_players, num_cards, ante, bet):
+    return KuhnGameTree(KuhnGame(num_players, num_cards, ante, bet))
+
+
+def game_tree(num_players=NUM_PLAYERS, num_cards=len(CARDS), ante=1, bet=1):
+    """
+    Compiled tree of a Kuhn Poker variant, built once per process
+    :return: KuhnGameTree
+    """
+    return _compiled_tree(num_players, num_cards, ante, bet)
+
+
+GAME_TREE = game_tree()
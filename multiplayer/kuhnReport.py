@@ -0,0 +1,262 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from multiplayer import kuhnHelper
+from multiplayer.trainingTrace import TraceReader
+
+# Reporting and plotting, kept out of kuhnHelper so trainers, simulators and their workers never load pandas or
+# matplotlib. Import this module only when a report or graph is wanted, matplotlib only loads once a graph is drawn
+
+# The seaborn style was renamed in matplotlib 3.6
+SEABORN_STYLE = 'seaborn-v0_8'
+
+
+def df_builder(results):
+    """
+    Cast over to DataFrame to analyze utility
+    :param results: dict { 'infoset': GameNode() }
+    :return: pd.DataFrame
+    """
+    res = [{'infoset': r, 'plays': results[r].plays, 'utility':results[r].utility_sum} for r in results]
+    return pd.DataFrame(res).set_index('infoset')
+
+
+def strat_df_builder(strat):
+    """
+    For Easy viewing of complete strategy profile, one row per history and one column per card
+    :param strat: dict {str: list[float]}
+    :return: pd.DataFrame - cells hold the [pass, bet] strategy of the info set, None where nobody acts
+    """
+    histories, cards = kuhnHelper._info_set_layout(strat)
+    rows = [[strat.get(card + history) for card in cards] for history in histories]
+    return pd.DataFrame(rows, index=[history or '-' for history in histories], columns=cards)
+
+
+# Strategies are probabilities, so every strategy plot shares these limits
+STRATEGY_YLIM = (-0.05, 1.05)
+
+
+def _plot_histories(trace_dir, paths, histories, cards, regret_ylim, max_points):
+    """
+    Render the strategy and regret of each history's info sets, one column per card. A single Figure is drawn for
+    every history, only the lines' data and the titles change between them. With regret_ylim every figure has the
+    same axes, so the tight layout, about half of the drawing time, is only computed for the first one
+    :param trace_dir:   str
+    :param paths:       list[str] - png to write for each history
+    :param histories:   list[str]
+    :param cards:       list[str]
+    :param regret_ylim: tuple - y limits of the regret plots, or None to fit each figure
+    :param max_points:  int   - snapshots drawn per line at most, evenly spaced
+    """
+    # Figures are drawn on an Agg canvas without pyplot, so no display or interactive backend is needed and nothing
+    # keeps them alive once saved
+    from matplotlib import style
+    from matplotlib.figure import Figure
+    style.use(SEABORN_STYLE if SEABORN_STYLE in style.available else 'seaborn')
+
+    trace = TraceReader(trace_dir)
+    iterations = trace.iterations()
+    step = max(-(-len(iterations) // max_points), 1)
+    iterations = iterations[::step]
+    fig = Figure(figsize=(2 * len(cards), 4), tight_layout=True)
+    axes = fig.subplots(nrows=2, ncols=len(cards), squeeze=False)
+    lines = [[ax.plot(iterations, np.zeros((len(iterations), trace.num_actions)), label=['pass', 'bet'])
+              for ax in row] for row in axes]
+
+    for ax in axes[0]:
+        ax.set_ylim(*STRATEGY_YLIM)
+    for ax in axes[1]:
+        if regret_ylim:
+            ax.set_ylim(*regret_ylim)
+    for ax, row in zip(axes[:, 0], ['Strategy', 'Regret']):
+        ax.set_ylabel(row, rotation=90)
+    axes[0, 0].legend()
+
+    for path, history in zip(paths, histories):
+        for col, card in enumerate(cards):
+            infoset = card + history
+            for row, column in enumerate(['strategy', 'regret']):
+                series = trace.series(infoset, column)[::step]
+                for line, values in zip(lines[row][col], series.T):
+                    line.set_ydata(values)
+            axes[0, col].set_title(infoset)
+            if not regret_ylim:
+                axes[1, col].relim()
+                axes[1, col].autoscale_view()
+        fig.savefig(path)
+        if regret_ylim:
+            # The subplot positions found for the first figure are kept for the rest
+            fig.set_layout_engine('none')
+
+
+def _plot_trace(trace_dir, base_dir, graph_suffix, regret_ylim=None, workers=None, max_points=2000):
+    # One figure per history. Workers each render a share of the histories, reading their info sets from the
+    # memory-mapped trace
+    histories, cards = kuhnHelper._trace_layout(TraceReader(trace_dir))
+    os.makedirs(base_dir + '/' + kuhnHelper.GRAPHS_DIR, exist_ok=True)
+    paths = [base_dir + '/' + kuhnHelper.GRAPHS_DIR + (graph_suffix if history == '' else history + graph_suffix)
+             for history in histories]
+
+    workers = min(workers or os.cpu_count() or 1, len(histories))
+    if workers <= 1:
+        _plot_histories(trace_dir, paths, histories, cards, regret_ylim, max_points)
+        return
+    jobs = [(trace_dir, paths[w::workers], histories[w::workers], cards, regret_ylim, max_points)
+            for w in range(workers)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Consume the results so a failed figure raises here
+        list(executor.map(_plot_histories, *zip(*jobs)))
+
+
+def plot_training(base_dir, workers=None):
+    """
+    :param base_dir: str
+    :param workers:  int - processes rendering figures, None for one per cpu
+    """
+    _plot_trace(base_dir + kuhnHelper.TRACE_DIR, base_dir, '_training.png', workers=workers)
+
+
+def plot_strat_and_regret(trace_dir, base_dir=None, workers=None):
+    """
+    :param trace_dir: str
+    :param base_dir:  str
+    :param workers:   int - processes rendering figures, None for one per cpu
+    """
+    _plot_trace(trace_dir, base_dir, '_training_strat.png', regret_ylim=(-5, 3), workers=workers)
+
+
+def _transform_data(cfr_strategy, br_strategies, player_result):
+    """
+    Strategy and utility tables of every player, indexed by the player's info sets ordered by card then history
+    :param cfr_strategy:  dict {str: list[float]}
+    :param br_strategies: list[dict] - best response of each player
+    :param player_result: list[pd.DataFrame] - main.calculate_utility of each player
+    :return: list[pd.DataFrame] - CFR then BR table of each player, columns bet, pass, plays, utility and avg
+    """
+    num_players = len(br_strategies)
+    histories, cards = kuhnHelper._info_set_layout(cfr_strategy)
+    histories = sorted(histories)
+    tables = []
+    for player, (br_strategy, utilities) in enumerate(zip(br_strategies, player_result)):
+        info_sets = [card + h for card in cards for h in histories if len(h) % num_players == player]
+        index = pd.Index(info_sets, name='Player{}'.format(player + 1))
+        utilities = utilities.reindex(info_sets)
+        for suffix, strategy in (('cfr', cfr_strategy), ('br', br_strategy)):
+            # Rows are [pass, bet]
+            pass_bet = np.array([strategy[info_set] for info_set in info_sets], dtype=float).reshape(-1, 2)
+            table = pd.DataFrame({'bet_' + suffix: pass_bet[:, 1], 'pass_' + suffix: pass_bet[:, 0]}, index=index)
+            for column in ['plays_', 'utility_', 'avg_']:
+                table[column + suffix] = utilities[column + suffix].to_numpy()
+            tables.append(table.round(2))
+    return tables
+
+
+def _report_formats(num_players, rows, result_rows):
+    """
+    Cell ranges of each kind of formatting on the report sheet, see make_excel for the layout
+    :param num_players: int
+    :param rows:        int - rows of the tallest player table
+    :param result_rows: int - rows of the results table
+    :return: dict {str: list[str]}
+    """
+    from xlsxwriter.utility import xl_range
+
+    top, gap, bottom = 1, rows + 2, 2 * rows + 4
+    cfr_rows, br_rows = (top + 1, top + rows), (gap + 2, gap + 1 + rows)
+    formats = {name: [] for name in ['strat', 'index', 'header', 'game', 'top_border', 'top_bottom_border',
+                                     'left_right_border', 'left_border']}
+    for player in range(num_players):
+        col = 1 + 7 * player
+        for first, last in (cfr_rows, br_rows):
+            formats['strat'].append(xl_range(first, col + 1, last, col + 2))
+            formats['index'].append(xl_range(first - 1, col, last, col))
+            formats['header'].append(xl_range(first - 1, col, first - 1, col + 5))
+            formats['game'].append(xl_range(first, col + 3, last, col + 5))
+            if player < num_players - 1:
+                formats['left_right_border'].append(xl_range(first, col + 6, last, col + 6))
+        formats['top_border'].append(xl_range(bottom, col + 1, bottom, col + 5))
+        formats['top_bottom_border'].append(xl_range(gap, col + 1, gap, col + 5))
+
+    # Results table, the epsilon below it
+    col = 1 + 7 * num_players
+    below, epsilon = top + result_rows + 1, top + result_rows + 2
+    formats['index'].append(xl_range(top, col, top + result_rows, col))
+    formats['header'] += [xl_range(top, col, top, col + num_players), xl_range(epsilon, col, epsilon, col)]
+    formats['game'] += [xl_range(top + 1, col + 1, top + result_rows, col + num_players),
+                        xl_range(epsilon, col + 1, epsilon, col + 1)]
+    if num_players > 1:
+        formats['top_border'].append(xl_range(below, col + 2, below, col + num_players))
+    formats['top_bottom_border'] += [xl_range(below, col + 1, below, col + 1), xl_range(epsilon, col, epsilon, col + 1)]
+    formats['left_right_border'] += [xl_range(top + 1, col - 1, top + result_rows, col - 1),
+                                     xl_range(epsilon, col - 1, epsilon, col - 1),
+                                     xl_range(epsilon, col, epsilon, col + 1)]
+    formats['left_border'] += [xl_range(below, col - 1, below, col - 1),
+                               xl_range(br_rows[0], col - 1, br_rows[1], col - 1),
+                               xl_range(top + 1, col + num_players + 1, top + result_rows, col + num_players + 1),
+                               xl_range(epsilon, col + 2, epsilon, col + 2)]
+    if epsilon < cfr_rows[1]:
+        formats['left_border'].append(xl_range(epsilon + 1, col - 1, cfr_rows[1], col - 1))
+    return formats
+
+
+def _write_row(sheet, header_format, df, top, col, row):
+    """
+    Write sheet row `row` of df placed with its header at (top, col). The index name and columns form the header row,
+    like DataFrame.to_excel, and rows outside the table are left alone
+    """
+    if row == top:
+        sheet.write_row(row, col, [df.index.name] + list(df.columns), header_format)
+    elif top < row <= top + len(df):
+        i = row - top - 1
+        sheet.write(row, col, df.index[i], header_format)
+        values = df.iloc[i].to_numpy(dtype=float)
+        sheet.write_row(row, col + 1, [None if np.isnan(value) else value for value in values])
+
+
+def make_excel(cfr_strategy, br_strategies, player_results, base_dir):
+    """
+    Creates Excel Report, for any number of players and cards. Each player gets a block of columns with the CFR table
+    on top of the BR table, the results table and epsilon follow the last player. Rows are written top to bottom, so
+    xlsxwriter streams each one to disk as soon as the next starts
+    :param cfr_strategy:   dict {str: list[float]}
+    :param br_strategies:  list[dict] - best response of each player
+    :param player_results: list - main.calculate_utility of each player, then the results table and epsilon
+    :param base_dir:       str
+    """
+    import xlsxwriter
+
+    num_players = len(br_strategies)
+    tables = _transform_data(cfr_strategy, br_strategies, player_results)
+    results, epsilon = player_results[num_players], player_results[num_players + 1]
+    results.index.name = 'Results'
+    rows = max(len(table) for table in tables)
+
+    # (table, header row, first column) of every table on the sheet
+    col = 1 + 7 * num_players
+    placed = [(results, 1, col)]
+    for player in range(num_players):
+        placed += [(tables[2 * player], 1, 1 + 7 * player), (tables[2 * player + 1], rows + 3, 1 + 7 * player)]
+    epsilon_row = len(results) + 3
+    last_row = max([epsilon_row] + [top + len(table) for table, top, _ in placed])
+
+    book = xlsxwriter.Workbook(base_dir + '/' + 'Kuhn_Poker_Results.xlsx', {'constant_memory': True})
+    sheet1 = book.add_worksheet('Sheet1')
+    header_format = book.add_format({'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'})
+    for row in range(1, last_row + 1):
+        for table, top, first_col in placed:
+            _write_row(sheet1, header_format, table, top, first_col, row)
+        if row == epsilon_row:
+            sheet1.write_row(row, col, ['Epsilon', epsilon])
+
+    cell_formats = {'header': {'bg_color': '#FFDAB9'}, 'index': {'bg_color': '#FFDAB9'},
+                    'game': {'bg_color': '#F0F8FF'}, 'top_border': {'top': 1}, 'top_bottom_border': {'top': 1, 'bottom': 1},
+                    'left_right_border': {'left': 1, 'right': 1}, 'left_border': {'left': 1}}
+    formats = _report_formats(num_players, rows, len(results))
+    for cells in formats.pop('strat'):
+        sheet1.conditional_format(cells, {'type': '3_color_scale'})
+    for name, ranges in formats.items():
+        cell_format = book.add_format(cell_formats[name])
+        for cells in ranges:
+            sheet1.conditional_format(cells, {'type': 'no_errors', 'format': cell_format})
+    book.close()
@@ -1,45 +1,76 @@
 from multiplayer import kuhnHelper
 from multiplayer import multiPlayerKuhnTrainer as mKuhnTrainer
 from multiplayer import multiPlayerKuhnPoker as mKuhnPoker
-import pandas as pd
+from multiplayer import vectorizedKuhnTrainer as vKuhnTrainer
+from multiplayer import parallelKuhnTrainer as pKuhnTrainer
+from multiplayer import bestResponse
+from multiplayer import exploitability
+from multiplayer.kuhnGame import DEFAULT_GAME
+from multiplayer.kuhnGameTree import game_tree
+from multiplayer.convergence import ConvergenceMonitor
+from functools import partial
 from datetime import datetime
+import json
 import os
 
-GRAPHS_DIR = '/graphs/'
 STRATS_DIR = '/trained_strategies/'
 RESULTS_DIR = '/results/'
-TRAINED_MODEL_FILES = ['cfr_strategy.p', 'p1_br_strategy.p', 'p2_br_strategy.p', 'p3_br_strategy.p']
-PLAYER_RESULT_FILES = ['p1_results.p', 'p2_results.p', 'p3_results.p', 'cfr_br_df.p']
+CONVERGENCE_FILE = '/convergence.json'
+# Largest game, in (deal, node) pairs, that main evaluates exactly unless asked to. Exact evaluation works over bounded
+# chunks of deals so memory stays flat, but its time grows with deals x nodes: about 15s for 5 players and 10 cards
+# (4.9 million pairs), minutes for 6 players and 10 cards
+EXACT_EVALUATION_LIMIT = 10 ** 7
 
 
-def setup_kuhn_poker_game(strategy, best_response=None):
+def setup_kuhn_poker_game(strategy, best_response=None, seed=None):
     """
     Prepare the strategies to be used for each info node. If a best_response strategy is provided,
     then replace the base strategy positions with the best response positions
     :param strategy:  dict
     :param best_response: dict
+    :param seed:      int - seed of the ActionSampler shared by every info node, None for a fresh one
     :return:
     """
     br_strategy = None
-    base_strategy = {i_s: mKuhnPoker.GameInfoSet(info_set=i_s, strategy=strategy[i_s]) for i_s in strategy}
+    sampler = mKuhnPoker.ActionSampler(seed)
+    base_strategy = {i_s: mKuhnPoker.GameInfoSet(info_set=i_s, strategy=strategy[i_s], sampler=sampler)
+                     for i_s in strategy}
     if best_response:
-        br_strategy = {i_s: mKuhnPoker.GameInfoSet(info_set=i_s, strategy=best_response[i_s]) for i_s in best_response}
+        br_strategy = {i_s: mKuhnPoker.GameInfoSet(info_set=i_s, strategy=best_response[i_s], sampler=sampler)
+                       for i_s in best_response}
 
     return {**base_strategy, **br_strategy} if best_response else base_strategy
 
 
-def play_kuhn_poker(base_strat, best_response_strat, iterations):
+def play_kuhn_poker(base_strat, best_response_strat, iterations, batched=False, game=None, seed=None):
     """
     Wrapper method that combines the cfr and best response strategies to configure the game
+    batched=True plays the hands in large NumPy batches with KuhnPoker.play_poker_batched
+    seed makes the dealt hands and the sampled actions reproducible
     """
-    node_map = setup_kuhn_poker_game(base_strat, best_response_strat)
-    results = mKuhnPoker.KuhnPoker(node_map).play_poker(iterations)
+    node_map = setup_kuhn_poker_game(base_strat, best_response_strat, seed)
+    game = mKuhnPoker.KuhnPoker(node_map, game)
+    results = game.play_poker_batched(iterations, seed=seed) if batched else game.play_poker(iterations, seed=seed)
     if best_response_strat:
         return {k: results[k] for k in best_response_strat}
 
     return results
 
 
+def evaluate_kuhn_poker(base_strat, best_response_strat, game=DEFAULT_GAME):
+    """
+    Exact counterpart of play_kuhn_poker. Instead of simulated counts, plays is the probability that a hand reaches the
+    info set and utility is the expected utility collected there, so the same DataFrames can be built without noise
+    :return: pd.DataFrame - same layout as kuhnReport.df_builder
+    """
+    import pandas as pd
+    strategy = {**base_strat, **best_response_strat} if best_response_strat else base_strat
+    results = exploitability.info_set_utilities(strategy, game_tree(*game.params()))
+    info_sets = best_response_strat if best_response_strat else results
+    res = [{'infoset': i, 'plays': results[i][0], 'utility': results[i][1]} for i in info_sets]
+    return pd.DataFrame(res).set_index('infoset')
+
+
 def calculate_utility(strat_df, br_player_df):
     # Join the CFR utilities with the best response utilities for one of the players
     df = strat_df.join(br_player_df, how='right', lsuffix='_cfr', rsuffix='_br')
@@ -53,15 +84,11 @@ def calculate_utility(strat_df, br_player_df):
 def calculate_nash_equilibrium(util_results):
     """
     Takes total utility and divides by rounds played for each player
-    :param util_results: tuple(pd.DataFrames)
+    :param util_results: tuple(pd.DataFrames) - one per player
     """
-    cfr = {'p1': util_results[0].utility_cfr.sum() / util_results[0].plays_cfr.sum(),
-           'p2': util_results[1].utility_cfr.sum() / util_results[1].plays_cfr.sum(),
-           'p3': util_results[2].utility_cfr.sum() / util_results[2].plays_cfr.sum()}
-
-    br = {'p1': util_results[0].utility_br.sum() / util_results[0].plays_br.sum(),
-          'p2': util_results[1].utility_br.sum() / util_results[1].plays_br.sum(),
-          'p3': util_results[2].utility_br.sum() / util_results[2].plays_br.sum()}
+    import pandas as pd
+    cfr = {'p{}'.format(p + 1): r.utility_cfr.sum() / r.plays_cfr.sum() for p, r in enumerate(util_results)}
+    br = {'p{}'.format(p + 1): r.utility_br.sum() / r.plays_br.sum() for p, r in enumerate(util_results)}
 
     cfr_results_df = pd.DataFrame(data=[cfr, br], index=['CFR', 'BR'])
     cfr_results_df.loc['diff'] = cfr_results_df.loc['BR'] - cfr_results_df.loc['CFR']
@@ -69,47 +96,109 @@ def calculate_nash_equilibrium(util_results):
     return cfr_results_df, epsilon
 
 
-def train(iterations=100, gen_graphs=False, base_dir=None):
+def calculate_exact_nash_equilibrium(cfr_strategy, br_strategies, game=DEFAULT_GAME):
+    """
+    Same table as calculate_nash_equilibrium, but from the exact expected utility of every player under the CFR
+    profile and when each player alone switches to its best response
+    :param cfr_strategy:  dict
+    :param br_strategies: list[dict]
+    :param game:          KuhnGame
+    """
+    import pandas as pd
+    players = ['p{}'.format(p + 1) for p in range(game.num_players)]
+    cfr_utilities, br_utilities = exploitability.best_response_gains(cfr_strategy, br_strategies,
+                                                                     game_tree(*game.params()))
+    cfr_results_df = pd.DataFrame(data=[cfr_utilities, br_utilities], index=['CFR', 'BR'], columns=players)
+    cfr_results_df.loc['diff'] = cfr_results_df.loc['BR'] - cfr_results_df.loc['CFR']
+    epsilon = cfr_results_df.loc['diff'].mean(axis=0)
+    print('Best response gains: {} NashConv: {}'.format(cfr_results_df.loc['diff'].tolist(), cfr_results_df.loc['diff'].sum()))
+    return cfr_results_df, epsilon
+
+
+def train(iterations=100, gen_graphs=False, base_dir=None, vectorized=False, workers=None, concurrent_br=False,
+          exact_br=False, trace_every=None, checkpoint_every=None, resume_from=None, update_rule='vanilla', game=None,
+          convergence=None):
     """
     Performs training to generate CFR strategy profile. Then it computes the best response strategy for each player
     while the opponents strategy do not change.
     :param iterations:
     :param gen_graphs:
     :param base_dir:
-    :return:
+    :param vectorized: bool - train on every deal per iteration with VectorizedKuhnTrainer instead of sampling one
+    :param workers:    int  - shard the sampled iterations across a pool of processes with ParallelKuhnTrainer
+    :param concurrent_br: bool - train the best responses at the same time, one process per player
+    :param exact_br:   bool - compute each best response exactly with one tree traversal instead of training it
+    :param trace_every: int - with gen_graphs, iterations between training snapshots (None for ~1000 per run)
+    :param checkpoint_every: int - iterations between CFR checkpoints written to base_dir
+    :param resume_from: str - CFR checkpoint to continue training from, iterations counts the resumed ones too
+    :param update_rule: str - CFR variant for the strategy profile: 'vanilla', 'cfr+', 'linear' or 'discounted'
+    :param game:       KuhnGame - Kuhn Poker variant to train, three players and four cards when None
+    :param convergence: dict - ConvergenceMonitor arguments, e.g. {'every': 10000, 'target': 0.001}. The profile and
+                        each trained best response then stop early once converged, iterations is only the cap. The
+                        curves are written to base_dir/convergence.json when that directory exists
+    :return: tuple - CFR strategy profile followed by the best response of every player
     """
-    # 1) Generate a strategy profile using CFR
-    print('Training Strategy Profile, this may take some time')
-    cfr_trainer = mKuhnTrainer.KuhnTrainer(training_best_response=False, generate_graphs=gen_graphs, base_dir=base_dir)
-    cfr_strategy_profiles = cfr_trainer.train(iterations)
+    game = game if game is not None else DEFAULT_GAME
+    monitors = {}
 
-    # 2) Compute a best response strategy for each player
-    print('Training Best Response for Player 1')
-    p1_br = mKuhnTrainer.KuhnTrainer(training_best_response=True,
-                                     best_response_player=0,
-                                     strategy_profile=cfr_strategy_profiles).train(iterations)
+    def monitor(name):
+        if convergence:
+            monitors[name] = ConvergenceMonitor(**convergence)
+            return monitors[name]
+
+    if vectorized and workers:
+        raise ValueError('Vectorized training enumerates every deal, it cannot be sharded across workers')
 
-    print('Training Best Response for Player 2')
-    p2_br = mKuhnTrainer.KuhnTrainer(training_best_response=True,
-                                     best_response_player=1,
-                                     strategy_profile=cfr_strategy_profiles).train(iterations)
+    if vectorized:
+        trainer = vKuhnTrainer.VectorizedKuhnTrainer
+    elif workers:
+        trainer = partial(pKuhnTrainer.ParallelKuhnTrainer, workers=workers)
+    else:
+        trainer = mKuhnTrainer.KuhnTrainer
 
-    print('Training Best Response for Player 3')
-    p3_br = mKuhnTrainer.KuhnTrainer(training_best_response=True,
-                                     best_response_player=2,
-                                     strategy_profile=cfr_strategy_profiles).train(iterations)
+    # 1) Generate a strategy profile using CFR
+    print('Training Strategy Profile, this may take some time')
+    cfr_trainer = trainer(training_best_response=False, generate_graphs=gen_graphs, base_dir=base_dir,
+                          trace_every=trace_every, checkpoint_every=checkpoint_every, update_rule=update_rule,
+                          game=game, convergence=monitor('cfr'))
+    cfr_strategy_profiles = cfr_trainer.train(iterations, resume_from=resume_from)
 
+    # 2) Compute a best response strategy for each player
+    if exact_br:
+        print('Computing exact Best Responses')
+        tree = game_tree(*game.params())
+        best_responses = bestResponse.compute_best_responses(cfr_strategy_profiles, tree)
+    elif concurrent_br:
+        print('Training Best Responses for all players concurrently')
+        best_responses = pKuhnTrainer.train_best_responses(cfr_strategy_profiles, iterations, vectorized, game)
+    else:
+        best_responses = []
+        for player in range(game.num_players):
+            print('Training Best Response for Player {}'.format(player + 1))
+            best_responses.append(trainer(training_best_response=True,
+                                          best_response_player=player,
+                                          strategy_profile=cfr_strategy_profiles,
+                                          game=game,
+                                          convergence=monitor('p{}_br'.format(player + 1))).train(iterations))
+
+    if monitors and base_dir and os.path.isdir(base_dir):
+        with open(base_dir + CONVERGENCE_FILE, 'w') as f:
+            json.dump({name: m.curve for name, m in monitors.items()}, f)
     print('Training complete')
-    return cfr_strategy_profiles, p1_br, p2_br, p3_br
+    return (cfr_strategy_profiles, *best_responses)
 
 
 def main(iterations=100000, run_training=True, training_mod_dir=None,
-         save_models=False, save_results=False, gen_graphs=False, gen_report=False):
+         save_models=False, save_results=False, gen_graphs=False, gen_report=False, vectorized=False,
+         workers=None, concurrent_br=False, exact_br=False, simulate=None,
+         batched_simulation=False, trace_every=None, checkpoint_every=None, resume_from=None,
+         update_rule='vanilla', game=None, seed=None, convergence=None):
     """
     Determine if CFR generated strategy profile is epsilon-Nash Equilibrium
     1) Generate a strategy profile using CFR
     2) Compute a best response strategy, using CFR, for each player
     3) Compute utilities for each position of the strategy profile by playing three strategies against each other*
+       (exactly, by enumerating every deal, unless simulate=True or the game is above EXACT_EVALUATION_LIMIT)
     4) Compute the utilities of the best response in each position by playing one BR strategy against
         two ordinary strategies
     5) Compare the BR strategy utilities in each position to the original strategies utilities to determine how much
@@ -123,50 +212,95 @@ def main(iterations=100000, run_training=True, training_mod_dir=None,
     :param save_models:      bool - when set to True, you save the trained model (serialized via pickle)
     :param save_results:     bool - you can also save the results of the simulations
     :param gen_graphs:       bool - generate graphs that show how the strategy evolves with regret accumulation
-                                    WARNING: this is not optimized. Space complexity: O(iterations*48)
+                                    snapshots are streamed to disk, memory does not grow with iterations
     :param gen_report:       bool - creates an excel report with CFR strategy, BR strategy, and simulation results
+    :param vectorized:       bool - train with VectorizedKuhnTrainer (every deal per iteration, no chance sampling)
+    :param workers:          int  - number of processes to shard training across, None trains in this process
+    :param concurrent_br:    bool - train the best response strategies in parallel processes
+    :param exact_br:         bool - compute exact best responses by tree traversal instead of training them with CFR
+    :param simulate:         bool - estimate utilities by playing iterations hands (Monte-Carlo) instead of computing
+                                    exact expected utilities. None computes them exactly up to EXACT_EVALUATION_LIMIT
+                                    (deal, node) pairs and simulates larger games
+    :param batched_simulation: bool - with simulate=True, play the hands in NumPy batches instead of one at a time
+    :param trace_every:      int  - with gen_graphs, iterations between training snapshots (None for ~1000 per run)
+    :param checkpoint_every: int  - write the raw CFR tables to <timestamp>/checkpoint.npz every this many iterations
+    :param resume_from:      str  - checkpoint file of an interrupted run, training continues up to iterations
+    :param update_rule:      str  - CFR variant used to train the strategy profile, see updateRules.UPDATE_RULES
+    :param game:             KuhnGame - number of players, deck size, ante and bet of the variant to solve. None is the
+                                    three player, four card game
+    :param seed:             int  - with simulate=True, seed for the dealt hands and sampled actions
+    :param convergence:      dict - stop training early once converged, see train. iterations becomes the cap
 
     usage:
     res = main(iterations=10000000, run_training=True, save_models=True, save_results=True, gen_graphs=True, gen_report=True)
+    res = main(iterations=100000, exact_br=True, game=KuhnGame(num_players=5, num_cards=10))
     """
+    game = game if game is not None else DEFAULT_GAME
+    model_files = kuhnHelper.trained_model_files(game.num_players)
+    result_files = kuhnHelper.player_result_files(game.num_players)
+
     timestamp = datetime.now().strftime('%Y_%m_%d_%H_%M')
-    if save_models or save_results or gen_graphs or gen_report:
+    if save_models or save_results or gen_graphs or gen_report or checkpoint_every:
         # only create a directory if we are persisting something
         os.makedirs(timestamp, exist_ok=True)
 
     # Step 1 & 2 - done in train method
     if run_training:
-        cfr_strategy, *br_strategies = train(iterations, gen_graphs=gen_graphs, base_dir=timestamp)
+        cfr_strategy, *br_strategies = train(iterations, gen_graphs=gen_graphs, base_dir=timestamp, vectorized=vectorized,
+                                             workers=workers, concurrent_br=concurrent_br,
+                                             exact_br=exact_br, trace_every=trace_every,
+                                             checkpoint_every=checkpoint_every, resume_from=resume_from,
+                                             update_rule=update_rule, game=game, convergence=convergence)
 
         if save_models:
             res = [cfr_strategy, *br_strategies]
-            kuhnHelper.save_results(results=res, file_names=TRAINED_MODEL_FILES, base_dir=timestamp, file_dir=STRATS_DIR)
+            kuhnHelper.save_results(results=res, file_names=model_files, base_dir=timestamp, file_dir=STRATS_DIR)
 
     else:
-        cfr_strategy, *br_strategies = kuhnHelper.load_trained_models(training_mod_dir)
-
-    # 3) Compute utilities for each position of the strategy profile by playing three strategies against each other
-    print('Playing Kuhn Poker with base strategy')
-    cfr_game_results = play_kuhn_poker(base_strat=cfr_strategy, best_response_strat=None, iterations=iterations)
-
-    # 4) Compute the utilities of the best response in each position by playing one BR strategy
-    #    against two ordinary strategies
-    print('Playing Kuhn Poker with best response strategies')
-    br_game_results = [play_kuhn_poker(base_strat=cfr_strategy, best_response_strat=br, iterations=iterations) for br in br_strategies]
-
-    # 5) Compare the BR strategy utilities in each position to the original strategies utilities to determine how much
-    #    extra the BR strategy wins in each position
-    cfr_game_results_df = kuhnHelper.df_builder(cfr_game_results)
-    br_game_results_df = [kuhnHelper.df_builder(r) for r in br_game_results]
-    player_results = [calculate_utility(cfr_game_results_df, br_profile) for br_profile in br_game_results_df]
-    cfr_br_df, epsilon = calculate_nash_equilibrium(player_results)
+        cfr_strategy, *br_strategies = kuhnHelper.load_trained_models(training_mod_dir, model_files)
+
+    if simulate is None:
+        tree = game_tree(*game.params())
+        simulate = len(tree.deals) * tree.num_nodes > EXACT_EVALUATION_LIMIT
+        if simulate:
+            print('{} deals x {} nodes is above EXACT_EVALUATION_LIMIT, simulating {} hands instead of evaluating '
+                  'exactly, pass simulate=False to force it'.format(len(tree.deals), tree.num_nodes, iterations))
+
+    if simulate:
+        from multiplayer import kuhnReport
+        # 3) Compute utilities for each position of the strategy profile by playing three strategies against each other
+        print('Playing Kuhn Poker with base strategy')
+        cfr_game_results = play_kuhn_poker(base_strat=cfr_strategy, best_response_strat=None, iterations=iterations,
+                                           batched=batched_simulation, game=game, seed=seed)
+
+        # 4) Compute the utilities of the best response in each position by playing one BR strategy
+        #    against two ordinary strategies
+        print('Playing Kuhn Poker with best response strategies')
+        br_game_results = [play_kuhn_poker(base_strat=cfr_strategy, best_response_strat=br, iterations=iterations,
+                                           batched=batched_simulation, game=game, seed=seed) for br in br_strategies]
+
+        # 5) Compare the BR strategy utilities in each position to the original strategies utilities to determine how much
+        #    extra the BR strategy wins in each position
+        cfr_game_results_df = kuhnReport.df_builder(cfr_game_results)
+        br_game_results_df = [kuhnReport.df_builder(r) for r in br_game_results]
+        player_results = [calculate_utility(cfr_game_results_df, br_profile) for br_profile in br_game_results_df]
+        cfr_br_df, epsilon = calculate_nash_equilibrium(player_results)
+    else:
+        # 3, 4 & 5) Exact expected utilities of the strategy profile and of each best response against it
+        print('Evaluating Kuhn Poker strategies exactly')
+        cfr_game_results_df = evaluate_kuhn_poker(base_strat=cfr_strategy, best_response_strat=None, game=game)
+        br_game_results_df = [evaluate_kuhn_poker(base_strat=cfr_strategy, best_response_strat=br, game=game)
+                              for br in br_strategies]
+        player_results = [calculate_utility(cfr_game_results_df, br_profile) for br_profile in br_game_results_df]
+        cfr_br_df, epsilon = calculate_exact_nash_equilibrium(cfr_strategy, br_strategies, game)
     player_results.extend([cfr_br_df, epsilon])
 
     if save_results:
-        kuhnHelper.save_results(results=player_results, file_names=PLAYER_RESULT_FILES, base_dir=timestamp, file_dir=RESULTS_DIR)
+        kuhnHelper.save_results(results=player_results, file_names=result_files, base_dir=timestamp, file_dir=RESULTS_DIR)
 
     if gen_report:
-        kuhnHelper.make_excel(cfr_strategy, br_strategies, player_results, base_dir=timestamp)
+        from multiplayer import kuhnReport
+        kuhnReport.make_excel(cfr_strategy, br_strategies, player_results, base_dir=timestamp)
 
     return cfr_strategy, br_strategies, player_results
 
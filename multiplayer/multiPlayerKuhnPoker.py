@@ -1,29 +1,50 @@
-from random import shuffle
 import numpy as np
 import random
 from multiplayer import kuhnHelper
+from multiplayer.kuhnGame import DEFAULT_GAME
+from multiplayer.kuhnGameTree import KuhnGameTree, game_tree, ACTIONS
+
+
+class ActionSampler:
+    """
+    Uniform draws for GameInfoSet.get_action. Draws are generated block_size at a time by a numpy.random.Generator and
+    handed out one by one as Python floats, so a decision costs a list pop instead of a NumPy call
+    """
+
+    def __init__(self, seed=None, block_size=65536):
+        self.rng = np.random.default_rng(seed)
+        self.block_size = block_size
+        self._draws = []
+
+    def random(self):
+        if not self._draws:
+            self._draws = self.rng.random(self.block_size).tolist()
+        return self._draws.pop()
 
 
 class GameInfoSet:
-    def __init__(self, info_set, strategy):
+    def __init__(self, info_set, strategy, sampler=None):
         self.info_set = info_set
         self.strategy = strategy
+        # With two actions, betting is chosen exactly when the draw is above the probability of passing
+        self.pass_threshold = strategy[0]
+        self.sampler = sampler
         self.plays = 0
         self.utility_sum = 0
 
     def get_action(self):
         """
         Determines which action to choose based on the probabilities of the strategy profile.
-        searchsorted takes a random value and looks where it would place it in the cumulative array
+        The cumulative strategy of [pass, bet] is [pass_threshold, 1], so a uniform draw at or below the threshold
+        passes and anything above it bets
 
         Example:
             strategy = [0.3, 0.7]
-            np.cumsum(strategy) = [0.3, 1]
-            np.searchsorted(np.cumsum(strategy), 0.39) = 1
-            np.searchsorted(np.cumsum(strategy), 0.29) = 0
+            draw 0.39 -> 'b'
+            draw 0.29 -> 'p'
         """
-        action = np.searchsorted(np.cumsum(self.strategy), random.random())
-        return 'p' if action == 0 else 'b'
+        draw = self.sampler.random() if self.sampler is not None else random.random()
+        return 'p' if draw <= self.pass_threshold else 'b'
 
     def update(self, utility):
         self.plays += 1
@@ -32,37 +53,34 @@ class GameInfoSet:
 
 class KuhnPoker:
 
-    def __init__(self, node_map):
+    def __init__(self, node_map, game=None):
         self.node_map = node_map
+        self.game = game if game is not None else DEFAULT_GAME
+        self.tree = game_tree(*self.game.params())
 
     def _update_node_utilities(self, info_sets, utility):
-        for info_set in info_sets:
-            player = kuhnHelper.determine_player_from_infoset(info_set)
+        for info_set, player in info_sets:
             node = self.node_map[info_set]
             node.update(utility[player])
 
-    def _play_round(self, cards, info_sets, history=''):
+    def _play_round(self, deal, info_sets, node=KuhnGameTree.ROOT):
         """
-        Recursively play rounds until a terminal state has beeen reached. Send all info nodes visited up the stack
-        and update utilities accordingly
-        :param cards:                     list [str] - cards played this round
-        :param info_sets: list [{str : GameInfoSet}] - all information sets that have been visited
-        :param history:                          str - previous actions
+        Play rounds until a terminal state has been reached, following one path down the compiled tree. Then update
+        the utilities of every info node visited on the way
+        :param deal:                                int - deal id in self.tree.deals
+        :param info_sets: list [(str, int)] - all information sets that have been visited and the player acting there
+        :param node:                                int - node id in self.tree of the current state
 
         """
-        plays = len(history)
-        current_player = plays % 3
+        tree = self.tree
+        while not tree.is_terminal(node):
+            info_set = tree.info_set(node, deal)
+            info_sets.append((info_set, tree.player_to_act(node)))
+            action = self.node_map[info_set].get_action()
+            node = tree.child(node, ACTIONS.index(action))
 
-        if kuhnHelper.is_terminal_state(plays, history):
-            utility = kuhnHelper.calculate_terminal_payoff(history, cards)
-            return self._update_node_utilities(info_sets, utility)
-
-        info_set = str(cards[current_player]) + history
-        info_sets.append(info_set)
-        node = self.node_map[info_set]
-        action = node.get_action()
-
-        self._play_round(cards, info_sets, history + action)
+        utility = tree.terminal_payoff(node, deal)
+        return self._update_node_utilities(info_sets, utility)
 
     @staticmethod
     def _compute_player_utility(player_positions):
@@ -76,16 +94,77 @@ class KuhnPoker:
         return avg_utility
 
     def _compute_average_utilities(self):
-        p1, p2, p3 = kuhnHelper.get_positions_from_strategy_profile(self.node_map)
-        p1_utility = self._compute_player_utility(p1)
-        p2_utility = self._compute_player_utility(p2)
-        p3_utility = self._compute_player_utility(p3)
-        return p1_utility, p2_utility, p3_utility
-
-    def play_poker(self, rounds=100):
-        cards = [3, 4, 1, 2]
+        positions = kuhnHelper.get_positions_from_strategy_profile(self.node_map, self.game)
+        return tuple(self._compute_player_utility(position) for position in positions)
+
+    def play_poker(self, rounds=100, seed=None):
+        """
+        :param rounds: int - number of hands
+        :param seed:   int - seed for shuffling the deals, None shuffles with the global random module
+        :return: dict {str: GameInfoSet} - node_map with updated plays and utility_sum
+        """
+        rng = random if seed is None else random.Random(seed)
+        cards = list(self.game.cards)
         for _ in range(rounds):
-            shuffle(cards)
-            self._play_round(cards, [], '')
+            rng.shuffle(cards)
+            self._play_round(self.tree.deal_id(cards), [])
+
+        return self.node_map
+
+    def play_poker_batched(self, rounds=100, batch_size=1000000, seed=None):
+        """
+        Same result as play_poker, but hands are played batch_size at a time in lockstep. Deals and the uniform draws
+        for every decision are generated as arrays up front, all hands of a batch take their nth action together, and
+        plays and utility per info set are accumulated with np.bincount
+        :param rounds:     int - number of hands
+        :param batch_size: int - hands simulated per batch, bounds memory use
+        :param seed:       int - seed for numpy.random.default_rng, None for a fresh one
+        :return: dict {str: GameInfoSet} - node_map with updated plays and utility_sum
+        """
+        tree = self.tree
+        rng = np.random.default_rng(seed)
+        info_sets = sorted(self.node_map)
+        info_set_ids = {info_set: i for i, info_set in enumerate(info_sets)}
+
+        # Info set id and probability of passing for every (decision node, card of the player acting there), so the
+        # tables grow with the tree rather than with deals x nodes
+        tree_ids = np.array([info_set_ids[info_set] for info_set in tree.info_sets])
+        card_info_sets = tree_ids[tree.card_info_set_rows]
+        pass_probability = np.array([self.node_map[i].strategy[0] for i in info_sets])[card_info_sets]
+
+        plays = np.zeros(len(info_sets), dtype=np.int64)
+        utility_sum = np.zeros(len(info_sets))
+        max_depth = tree.depth.max()
+        while rounds > 0:
+            hands = min(rounds, batch_size)
+            rounds -= hands
+            deals = rng.integers(len(tree.deals), size=hands)
+            draws = rng.random((max_depth, hands))
+            node = np.zeros(hands, dtype=np.int64)
+            visits = []
+            for depth in range(max_depth):
+                hand = np.flatnonzero(~tree.terminal[node])
+                if len(hand) == 0:
+                    break
+                current = node[hand]
+                player = tree.player[current]
+                k = tree.decision_index[current]
+                card = tree.deals[deals[hand], player] - tree.cards[0]
+                visits.append((hand, card_info_sets[k, card], player))
+                # searchsorted(cumsum(strategy), r) in get_action bets exactly when r is above the pass probability
+                action = draws[depth, hand] > pass_probability[k, card]
+                node[hand] = tree.children[current, action.astype(np.int64)]
+
+            utility = tree.ranked_payoffs[tree.terminal_id[node], tree.deal_ranking[deals]]
+            for hand, info_set, player in visits:
+                plays += np.bincount(info_set, minlength=len(info_sets))
+                utility_sum += np.bincount(info_set, weights=utility[hand, player], minlength=len(info_sets))
+
+        # Sums of whole chip payoffs are exact in float64 and stay integers, fractional stakes keep their float sums
+        whole_stakes = float(self.game.ante).is_integer() and float(self.game.bet).is_integer()
+        for i, info_set in enumerate(info_sets):
+            node = self.node_map[info_set]
+            node.plays += int(plays[i])
+            node.utility_sum += int(utility_sum[i]) if whole_stakes else float(utility_sum[i])
 
-        return self.node_map
\ No newline at end of file
+        return self.node_map
@@ -1,8 +1,12 @@
-from random import shuffle
+import random
+from time import perf_counter
 from multiplayer import kuhnHelper
+from multiplayer.kuhnGame import DEFAULT_GAME
+from multiplayer.kuhnGameTree import game_tree
+from multiplayer.trainingTrace import TraceWriter
+from multiplayer.checkpoint import CheckpointWriter, load_checkpoint
+from multiplayer.updateRules import get_update_rule
 import numpy as np
-from io import StringIO
-from csv import writer
 
 # Aggressive - B
 B = 'BET'
@@ -13,22 +17,88 @@ K = 'CHECK'
 F = 'FOLD'
 
 
+class InfoSetStore:
+    """
+    Contiguous storage for the cumulative regrets and strategies of every info set. Row i of regret_sum and
+    strategy_sum belongs to info_sets[i]. Rows are handed out as info sets are first visited and the matrices double in
+    size when they run out of room, so TrainerInfoSet views look their row up through the store on every access.
+
+    flat_regret_sum and flat_strategy_sum are 1-D memoryviews over the same memory (cell row * num_actions + action).
+    They give the recursive trainer Python float reads and writes, which are much cheaper than NumPy operations on a
+    two element row.
+    """
+
+    def __init__(self, num_actions=2, capacity=64):
+        self.num_actions = num_actions
+        self.info_sets = []
+        self.index = {}
+        self._allocate(np.zeros((capacity, num_actions)), np.zeros((capacity, num_actions)))
+
+    def _allocate(self, regret_sum, strategy_sum):
+        self.regret_sum = regret_sum
+        self.strategy_sum = strategy_sum
+        self.flat_regret_sum = memoryview(regret_sum).cast('B').cast('d')
+        self.flat_strategy_sum = memoryview(strategy_sum).cast('B').cast('d')
+
+    def __len__(self):
+        return len(self.info_sets)
+
+    def __getstate__(self):
+        # memoryviews cannot be pickled, they are rebuilt from the arrays on load
+        state = self.__dict__.copy()
+        del state['flat_regret_sum'], state['flat_strategy_sum']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._allocate(self.regret_sum, self.strategy_sum)
+
+    def add(self, info_set):
+        """
+        Reserve a row for an info set
+        :param info_set: str
+        :return: int - row of the info set
+        """
+        if info_set in self.index:
+            return self.index[info_set]
+
+        row = len(self.info_sets)
+        if row == len(self.regret_sum):
+            self._allocate(np.concatenate([self.regret_sum, np.zeros_like(self.regret_sum)]),
+                           np.concatenate([self.strategy_sum, np.zeros_like(self.strategy_sum)]))
+        self.info_sets.append(info_set)
+        self.index[info_set] = row
+        return row
+
+    def get_average_strategy(self):
+        """
+        Average strategy of every info set at once
+        :return: np.array (info sets, actions)
+        """
+        strategy_sum = self.strategy_sum[:len(self)]
+        normalizing_sum = strategy_sum.sum(axis=1, keepdims=True)
+        return np.divide(strategy_sum, normalizing_sum,
+                         out=np.full_like(strategy_sum, 1.0 / self.num_actions), where=normalizing_sum > 0)
+
+
 class TrainerInfoSet:
-    # Information set node class definition
+    # Information set node class definition. A light view over one row of an InfoSetStore
     NUM_ACTIONS = 2
+    __slots__ = ['info_set', 'store', 'index']
 
-    def __init__(self, info_set='', gen_graphs=False):
+    def __init__(self, info_set='', store=None):
         # Kuhn Node Definitions
         self.info_set = info_set
-        self.regret_sum = [0] * self.NUM_ACTIONS
-        self.strategy_sum = [0] * self.NUM_ACTIONS
-        self.gen_graphs = gen_graphs
+        self.store = store if store is not None else InfoSetStore(self.NUM_ACTIONS, capacity=1)
+        self.index = self.store.add(info_set)
 
-        self.strat_output = StringIO()
-        self.strat_csv_writer = writer(self.strat_output)
+    @property
+    def regret_sum(self):
+        return self.store.regret_sum[self.index]
 
-        self.regret_output = StringIO()
-        self.regret_csv_writer = writer(self.regret_output)
+    @property
+    def strategy_sum(self):
+        return self.store.strategy_sum[self.index]
 
     def get_strategy(self, realization_weight):
         """
@@ -36,10 +106,14 @@ class TrainerInfoSet:
         :param realization_weight:
         :return:
         """
+        regret_sum = self.store.flat_regret_sum
+        strategy_sum = self.store.flat_strategy_sum
+        cell = self.index * self.NUM_ACTIONS
+
         normalizing_sum = 0.0
         strategy = [0.0] * self.NUM_ACTIONS
         for i in range(0, self.NUM_ACTIONS):
-            strategy[i] = self.regret_sum[i] if self.regret_sum[i] > 0 else 0.0
+            strategy[i] = regret_sum[cell + i] if regret_sum[cell + i] > 0 else 0.0
             normalizing_sum += strategy[i]
 
         for i in range(0, self.NUM_ACTIONS):
@@ -48,11 +122,7 @@ class TrainerInfoSet:
             else:
                 strategy[i] = 1.0 / self.NUM_ACTIONS
 
-            self.strategy_sum[i] += realization_weight * strategy[i]
-
-        if self.gen_graphs:
-            avg_strat = self.get_average_strategy()
-            self.strat_csv_writer.writerow(avg_strat)
+            strategy_sum[cell + i] += realization_weight * strategy[i]
 
         return strategy
 
@@ -61,24 +131,21 @@ class TrainerInfoSet:
         Get average information set mixed strategy across all training iterations
         :return:
         """
+        strategy_sum = self.strategy_sum.tolist()
         avg_strategy = [0] * self.NUM_ACTIONS
-        normalizing_sum = 0.0
-        for i in range(0, self.NUM_ACTIONS):
-            normalizing_sum += self.strategy_sum[i]
-
+        normalizing_sum = sum(strategy_sum)
         for i in range(0, self.NUM_ACTIONS):
             if normalizing_sum > 0:
-                avg_strategy[i] = self.strategy_sum[i] / normalizing_sum
+                avg_strategy[i] = strategy_sum[i] / normalizing_sum
             else:
                 avg_strategy[i] = 1.0 / self.NUM_ACTIONS
 
         return avg_strategy
 
     def to_string(self):
-        # TODO: remove?
-        # Get info set string representation
+        # Get info set string representation, actions are ordered as in kuhnGame.ACTIONS
         avg_strat = self.get_average_strategy()
-        print('info_set is: {0} and average strategy for BET: {1.4f} PASS: {2:.4f}'.format(self.info_set, avg_strat[0], avg_strat[1]))
+        print('info_set is: {0} and average strategy for PASS: {1:.4f} BET: {2:.4f}'.format(self.info_set, avg_strat[0], avg_strat[1]))
 
 
 class KuhnTrainer:
@@ -86,123 +153,412 @@ class KuhnTrainer:
     PASS = 0
     BEST = 1
     NUM_ACTIONS = 2
-    NUM_PLAYERS = 3
-
-    def __init__(self, training_best_response=False, best_response_player=None, strategy_profile=None, generate_graphs=False, base_dir=None):
+    SAMPLING_MODES = ['chance', 'external', 'outcome']
+    # Probability that outcome sampling explores a uniformly random action at the traverser's nodes
+    EXPLORATION = 0.6
+
+    def __init__(self, training_best_response=False, best_response_player=None, strategy_profile=None, generate_graphs=False, base_dir=None, seed=None,
+                 trace_every=None, checkpoint_every=None, checkpoint_path=None, update_rule='vanilla', sampling='chance',
+                 game=None, stats=None, convergence=None):
+        # Rules of the Kuhn Poker variant being trained, compiled into a tree that is shared by every trainer of the game
+        self.game = game if game is not None else DEFAULT_GAME
+        self.tree = game_tree(*self.game.params())
+        self.num_players = self.game.num_players
+        # Per node buffers of the iterative cfr traversal, the root always keeps a reach of 1 for every player
+        self._decision_nodes = self.tree.decision_nodes.tolist()
+        self._reach = [[1.0] * self.num_players for _ in range(self.tree.num_nodes)]
+        self._node_strategies = [None] * self.tree.num_nodes
+        # Utility of every player below each node, written in place through a flat view (row node * num_players)
+        self._node_utilities = np.zeros((self.tree.num_nodes, self.num_players))
+        self._flat_node_utilities = memoryview(self._node_utilities).cast('B').cast('d')
+        self._child_rows = (self.tree.children * self.num_players).tolist()
+        self._info_set_nodes = [None] * self.tree.num_nodes
         self.training_best_response = training_best_response
         self.best_response_player = best_response_player
         self.strategy_profile = strategy_profile
         self.node_map = {}
+        self.store = InfoSetStore(self.NUM_ACTIONS)
         self.gen_graphs = generate_graphs
         self.base_dir = base_dir
+        # Graph data is snapshotted to disk every trace_every iterations, by default about 1000 times per run
+        self.trace_every = trace_every
+        self.trace = None
+        # Deals are shuffled with the global random module unless a seed asks for a private generator
+        self.rng = random if seed is None else random.Random(seed)
+        self.deck = list(self.game.cards)
+
+        # Iterations and summed root utilities so far, carried over when a run is resumed from a checkpoint
+        self.iteration = 0
+        self.util = 0
+        if checkpoint_every and checkpoint_path is None and base_dir is None:
+            raise ValueError('checkpoint_every needs a checkpoint_path or a base_dir to write checkpoints to')
+        self.checkpoint_every = checkpoint_every
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint = None
+        # Opt-in instrumentation, see trainerStats.TrainerStats. Hot paths only test it against None when it is off
+        self.stats = stats
+        # Early stopping, see convergence.ConvergenceMonitor. Training runs its full iteration count when None
+        self.convergence = convergence
+
+        # Regret and average strategy update rule, see updateRules. traverser is the only player updated this
+        # iteration when the rule alternates updates, None when every player is updated
+        self.update_rule = get_update_rule(update_rule)
+        self.traverser = None
+        self._set_traverser()
+
+        # chance:   every iteration samples a deal and traverses the whole betting tree (cfr)
+        # external: Monte Carlo CFR, the traverser tries every action and opponents sample one from their strategy
+        # outcome:  Monte Carlo CFR, a single betting sequence is sampled per traverser
+        if sampling not in self.SAMPLING_MODES:
+            raise ValueError('Unknown sampling mode {}, expected one of {}'.format(sampling, self.SAMPLING_MODES))
+        self.sampling = sampling
+
+    def cfr(self, deal):
+        """
+        Counterfactual regret minimization for Kuhn Poker over the whole betting tree of one deal, without recursion.
+        Node ids are breadth first, so a forward sweep over the decision nodes pushes reach probabilities down to the
+        children before they are visited, and a backward sweep gathers utilities up from them. Both sweeps work in
+        per node buffers that are reused by every call
+        :param deal: int - deal id in self.tree.deals
+        :return: np.array - utility of the root for players 1, 2, 3, ...
+        """
+        tree = self.tree
+        stats = self.stats
+        reach_probabilities = self._reach
+        strategies = self._node_strategies
+        info_set_nodes = self._info_set_nodes
+        node_utilities = self._node_utilities
+
+        for node in self._decision_nodes:
+            current_player = tree.player_to_act(node)
+            node_reach = reach_probabilities[node]
+
+            if stats is not None:
+                start = perf_counter()
+
+            # Get information set node or create it if has not been visited yet
+            info_set = tree.info_set(node, deal)
+            info_set_node = self.node_map.get(info_set)
+            if info_set_node is None:
+                info_set_node = self.node_map[info_set] = TrainerInfoSet(info_set, self.store)
+
+            # Best Response Strategies for opponents are pre-defined and provided to the class.
+            if self.training_best_response and self.best_response_player != current_player:
+                strategy = self.strategy_profile[info_set]
+            else:
+                # Get updated strategy based on cumulative regret. Players not being updated add nothing to their average
+                updating = self.traverser is None or self.traverser == current_player
+                strategy = info_set_node.get_strategy(node_reach[current_player] if updating else 0.0)
+            strategies[node] = strategy
+            if stats is not None:
+                stats.visit(info_set, perf_counter() - start)
+            info_set_nodes[node] = info_set_node
+
+            # Each child is reached with the additional probability of the action leading to it
+            for a in range(0, self.NUM_ACTIONS):
+                child_reach = reach_probabilities[tree.child(node, a)]
+                child_reach[:] = node_reach
+                child_reach[current_player] *= strategy[a]
+
+        # Terminal Utility is pre-defined for each player based on the deal
+        node_utilities[tree.terminal_nodes] = tree.ranked_payoffs[:, tree.deal_ranking[deal]]
+        utilities = self._flat_node_utilities
+        num_players = self.num_players
+        regret_sum = self.store.flat_regret_sum
+        for node in reversed(self._decision_nodes):
+            current_player = tree.player_to_act(node)
+            strategy = strategies[node]
+            row = node * num_players
 
-    def cfr(self, cards, history, reach_probabilities):
-        """
-        Counterfactual regret minimization for Kuhn Poker
-        :param cards:   list[int] -
-        :param history: string    -
-        :param reach_probabilities: list [ float ] - probability of action for players 1, 2, 3
-        :param
-        :return: terminal_utilities: dict {str: list[int]}
-        """
-        plays = len(history)
-        current_player = plays % 3
-        rp0, rp1, rp2 = reach_probabilities
-        util = [0.0] * self.NUM_ACTIONS
-        terminal_utilities = np.zeros(self.NUM_PLAYERS)
-
-        if kuhnHelper.is_terminal_state(plays, history):
-            # Terminal Utility is pre-defined for each player based on the current state
-            utility = kuhnHelper.calculate_terminal_payoff(history, cards)
-            return utility
-
-        # Get information set node or create it if has not been visited yet
-        info_set = str(cards[current_player]) + history
-        if info_set in self.node_map:
-            info_set_node = self.node_map[info_set]
-        else:
-            info_set_node = TrainerInfoSet(info_set, self.gen_graphs)
-            self.node_map[info_set] = info_set_node
-
-        # Best Response Strategies for opponents are pre-defined and provided to the class.
-        if self.training_best_response and self.best_response_player != current_player:
+            # Used to pass up to parent infoset
+            child_rows = self._child_rows[node]
+            for p in range(num_players):
+                utility = 0.0
+                for a in range(0, self.NUM_ACTIONS):
+                    utility += strategy[a] * utilities[child_rows[a] + p]
+                utilities[row + p] = utility
+
+            if self.traverser is not None and self.traverser != current_player:
+                continue
+
+            # For each action, compute and accumulate counterfactual regret
+            # CFR is weighted by the counterfactual reach of the state: the product of every opponent's reach
+            # probability. The deal is sampled, so chance adds the same factor to every regret and is left out
+            node_util = utilities[row + current_player]
+            node_reach = reach_probabilities[node]
+            reach = 1.0
+            for p in range(num_players):
+                if p != current_player:
+                    reach *= node_reach[p]
+            cell = info_set_nodes[node].index * self.NUM_ACTIONS
+            for i in range(0, self.NUM_ACTIONS):
+                regret_sum[cell + i] += reach * (utilities[child_rows[i] + current_player] - node_util)
+
+        if stats is not None:
+            stats.terminal_evaluations += len(tree.terminal_nodes)
+        return node_utilities[tree.ROOT].copy()
+
+    def _info_set_strategy(self, deal, node, player, realization_weight):
+        """
+        Info set of the acting player and the strategy it plays, fixed opponents of a best response play their profile
+        :return: (TrainerInfoSet, list[float])
+        """
+        if self.stats is not None:
+            start = perf_counter()
+        info_set = self.tree.info_set(node, deal)
+        info_set_node = self.node_map.get(info_set)
+        if info_set_node is None:
+            info_set_node = self.node_map[info_set] = TrainerInfoSet(info_set, self.store)
+
+        if self.training_best_response and self.best_response_player != player:
             strategy = self.strategy_profile[info_set]
         else:
-            # Get updated strategy based on cumulative regret
-            strategy = info_set_node.get_strategy(reach_probabilities[current_player])
-
-        for a in range(0, self.NUM_ACTIONS):
-            # For each action, recursively call cfr with additional history and probability
-            next_history = history + ('p' if a == 0 else 'b')
-            if current_player == 0:
-                child_utilities = self.cfr(cards, next_history, [rp0 * strategy[a], rp1, rp2])
-            elif current_player == 1:
-                child_utilities = self.cfr(cards, next_history, [rp0, rp1 * strategy[a], rp2])
-            else:  # Player 2
-                child_utilities = self.cfr(cards, next_history, [rp0, rp1, rp2 * strategy[a]])
-
-            # Calculating CFR for the current infoset
-            util[a] = child_utilities[current_player]
-
-            # Used to pass up to parent infoset
-            weighted_utilities = [strategy[a] * z for z in child_utilities]
-            terminal_utilities = np.add(terminal_utilities, weighted_utilities)
-
-        node_util = terminal_utilities[current_player]
-
-        # For each action, compute and accumulate counterfactual regret
-        for i in range(0, self.NUM_ACTIONS):
-            regret = util[i] - node_util
-            # CFR is multiplied by reach probability (from previous player) of getting to the current state
-            if current_player == 0:
-                info_set_node.regret_sum[i] += rp2 * regret
-            elif current_player == 1:
-                info_set_node.regret_sum[i] += rp0 * regret
+            strategy = info_set_node.get_strategy(realization_weight)
+        if self.stats is not None:
+            self.stats.visit(info_set, perf_counter() - start)
+        return info_set_node, strategy
+
+    def _sample_action(self, probabilities):
+        r = self.rng.random()
+        for a in range(self.NUM_ACTIONS - 1):
+            r -= probabilities[a]
+            if r < 0:
+                return a
+        return self.NUM_ACTIONS - 1
+
+    def external_sampling_cfr(self, deal, node, traverser, own_reach, sample_reach):
+        """
+        External sampling MCCFR. Only the traverser branches, so a traversal visits O(2^(traverser's decisions)) nodes
+        rather than the whole tree.
+        :param deal:         int   - deal id in self.tree.deals
+        :param node:         int   - node id in self.tree
+        :param traverser:    int   - player whose regrets are updated
+        :param own_reach:    float - probability of the traverser's own actions leading here
+        :param sample_reach: float - probability that the opponents' sampled actions lead here
+        :return: float - sampled counterfactual value of the node for the traverser
+        """
+        tree = self.tree
+        if tree.is_terminal(node):
+            if self.stats is not None:
+                self.stats.terminal_evaluations += 1
+            return tree.terminal_payoff(node, deal)[traverser]
+
+        current_player = tree.player_to_act(node)
+        if current_player != traverser:
+            info_set_node, strategy = self._info_set_strategy(deal, node, current_player, 0.0)
+            a = self._sample_action(strategy)
+            return self.external_sampling_cfr(deal, tree.child(node, a), traverser, own_reach,
+                                              sample_reach * strategy[a])
+
+        # Average strategy weight own_reach / sample_reach is unbiased for own_reach over the sampled opponent actions
+        info_set_node, strategy = self._info_set_strategy(deal, node, current_player, own_reach / sample_reach)
+        util = [self.external_sampling_cfr(deal, tree.child(node, a), traverser, own_reach * strategy[a],
+                                           sample_reach) for a in range(self.NUM_ACTIONS)]
+        node_util = sum(strategy[a] * util[a] for a in range(self.NUM_ACTIONS))
+
+        regret_sum = self.store.flat_regret_sum
+        cell = info_set_node.index * self.NUM_ACTIONS
+        for a in range(self.NUM_ACTIONS):
+            regret_sum[cell + a] += util[a] - node_util
+        return node_util
+
+    def outcome_sampling_cfr(self, deal, node, traverser, own_reach, opponent_reach, sample_reach):
+        """
+        Outcome sampling MCCFR. One betting sequence is sampled, exploring at the traverser's nodes, and the values
+        along it are importance weighted by the probability of sampling it. A traversal visits tree depth nodes.
+        :param deal:           int   - deal id in self.tree.deals
+        :param node:           int   - node id in self.tree
+        :param traverser:      int   - player whose regrets are updated
+        :param own_reach:      float - probability of the traverser's own actions leading here
+        :param opponent_reach: float - probability of the opponents' actions leading here
+        :param sample_reach:   float - probability of sampling the actions leading here
+        :return: float - importance weighted estimate of the node value for the traverser
+        """
+        tree = self.tree
+        if tree.is_terminal(node):
+            if self.stats is not None:
+                self.stats.terminal_evaluations += 1
+            return tree.terminal_payoff(node, deal)[traverser]
+
+        current_player = tree.player_to_act(node)
+        if current_player != traverser:
+            info_set_node, strategy = self._info_set_strategy(deal, node, current_player, 0.0)
+            # Opponents sample on policy, so the importance weights of their actions cancel in the value estimate
+            a = self._sample_action(strategy)
+            return self.outcome_sampling_cfr(deal, tree.child(node, a), traverser, own_reach,
+                                             opponent_reach * strategy[a], sample_reach * strategy[a])
+
+        info_set_node, strategy = self._info_set_strategy(deal, node, current_player, own_reach / sample_reach)
+        sample_probabilities = [self.EXPLORATION / self.NUM_ACTIONS + (1 - self.EXPLORATION) * s for s in strategy]
+        a = self._sample_action(sample_probabilities)
+        child_value = self.outcome_sampling_cfr(deal, tree.child(node, a), traverser, own_reach * strategy[a],
+                                                opponent_reach, sample_reach * sample_probabilities[a])
+
+        # Unsampled actions are estimated as 0, the sampled one is divided by its sampling probability
+        action_value = child_value / sample_probabilities[a]
+        node_value = strategy[a] * action_value
+
+        regret_sum = self.store.flat_regret_sum
+        cell = info_set_node.index * self.NUM_ACTIONS
+        weight = opponent_reach / sample_reach
+        for b in range(self.NUM_ACTIONS):
+            regret_sum[cell + b] += weight * ((action_value if b == a else 0.0) - node_value)
+        return node_value
+
+    def _traversers(self):
+        if self.training_best_response:
+            return [self.best_response_player]
+        if self.traverser is not None:
+            return [self.traverser]
+        return range(self.num_players)
+
+    def _sampled_iteration(self, deal):
+        """
+        One MCCFR iteration on a dealt hand, a traversal for every player being updated
+        :return: np.array - sampled values for every player (0 for players that were not traversed)
+        """
+        util = np.zeros(self.num_players)
+        for player in self._traversers():
+            if self.sampling == 'external':
+                util[player] = self.external_sampling_cfr(deal, self.tree.ROOT, player, 1.0, 1.0)
             else:
-                info_set_node.regret_sum[i] += rp1 * regret
-
-        if self.gen_graphs:
-            r = info_set_node.regret_sum.copy()
-            info_set_node.regret_csv_writer.writerow(r)
-
-        return terminal_utilities
+                util[player] = self.outcome_sampling_cfr(deal, self.tree.ROOT, player, 1.0, 1.0, 1.0)
+        return util
 
     def _return_player_strats(self, strategy_profile):
-        # Player 1, 2, and 3's betting strategies
-        p1, p2, p3 = kuhnHelper.get_positions_from_strategy_profile(strategy_profile)
-
-        if self.best_response_player == 0:
-            return p1
-        elif self.best_response_player == 1:
-            return p2
-        elif self.best_response_player == 2:
-            return p3
+        # Betting strategies of every player
+        positions = kuhnHelper.get_positions_from_strategy_profile(strategy_profile, self.game)
+
+        if self.best_response_player is not None:
+            return positions[self.best_response_player]
         else:
             # No best response player, so training CFR for all players
             return strategy_profile
 
-    def train(self, iterations):
+    def load_tables(self, info_sets, regret_sum, strategy_sum):
         """
-        Train Kuhn Poker
+        Replace the trainer's info sets with previously accumulated regrets and strategies
+        :param info_sets:   list[str]
+        :param regret_sum:   np.array (info sets, actions)
+        :param strategy_sum: np.array (info sets, actions)
+        """
+        self.store = InfoSetStore(self.NUM_ACTIONS, capacity=max(len(info_sets), 1))
+        self.node_map = {info_set: TrainerInfoSet(info_set, self.store) for info_set in info_sets}
+        self.store.regret_sum[:len(info_sets)] = regret_sum
+        self.store.strategy_sum[:len(info_sets)] = strategy_sum
+
+    def _run_iterations(self, iterations):
+        """
+        Run CFR, or an MCCFR iteration, on a freshly shuffled deal for each iteration
         :param iterations:
-        :return:
+        :return: np.array - summed root utilities for every player
         """
-        strategy_profile = {}
-        cards = [1, 2, 3, 4]
         util = 0
         for _ in range(iterations):
-            shuffle(cards)
-            util += self.cfr(cards, '', [1, 1, 1])
+            self.rng.shuffle(self.deck)
+            if self.sampling == 'chance':
+                util += self.cfr(self.tree.deal_id(self.deck))
+            else:
+                util += self._sampled_iteration(self.tree.deal_id(self.deck))
+            self._end_iteration(util)
+        return util
+
+    def _set_traverser(self):
+        self.traverser = self.iteration % self.num_players if self.update_rule.alternating else None
+
+    def _end_iteration(self, util):
+        # Count the iteration, apply the update rule and hand the tables to the trace and checkpoint writers when due
+        self.iteration += 1
+        self.update_rule.end_iteration(self.store, self.iteration)
+        self._set_traverser()
+        if self.trace:
+            self.trace.record(self.iteration, self.store)
+        if self.checkpoint:
+            self.checkpoint.submit(self.iteration, self.store, self.util + util, self.rng, self.deck)
+        if self.stats:
+            self.stats.record(self.iteration)
+
+    def resume(self, path):
+        """
+        Continue from a checkpoint: tables, iteration count, summed utilities, and the deal shuffling state
+        :param path: str
+        """
+        state = load_checkpoint(path)
+        self.load_tables(state['info_sets'], state['regret_sum'], state['strategy_sum'])
+        self.iteration = state['iteration']
+        self.util = state['util']
+        self.rng.setstate(state['rng_state'])
+        self.deck = state['deck']
+        self._set_traverser()
+
+    def _open_trace(self, iterations):
+        """
+        Start streaming training snapshots of every info set into base_dir
+        :param iterations: int
+        :return: TraceWriter
+        """
+        info_sets = sorted(name for n in self.tree.decision_nodes for name in self.tree.info_set_names[n].values())
+        every = self.trace_every or max(iterations // 1000, 1)
+        return TraceWriter(self.base_dir + kuhnHelper.TRACE_DIR, info_sets, self.NUM_ACTIONS, every)
 
-        print('Average game value: {}'.format(util / iterations))
+    def _close_trace(self):
+        self.trace.close()
+        self.trace = None
+        from multiplayer import kuhnReport
+        kuhnReport.plot_strat_and_regret(self.base_dir + kuhnHelper.TRACE_DIR, self.base_dir)
+
+    def _average_strategy_profile(self):
+        strategy_profile = {}
         for info_set in sorted(self.node_map):
             node = self.node_map[info_set]
             avg_strat = node.get_average_strategy()
             strategy_profile[info_set] = [avg_strat[0], avg_strat[1]]
+        return strategy_profile
+
+    def _train_until_converged(self, iterations):
+        # Train in slices of convergence.every iterations until the monitor stops it or iterations are done
+        while self.iteration < iterations:
+            self.util += self._run_iterations(min(self.convergence.every, iterations - self.iteration))
+            if self.convergence.check(self):
+                print('Converged after {} iterations: {} {}'.format(self.iteration, self.convergence.metric,
+                                                                   self.convergence.curve[-1][1]))
+                return
+
+    def train(self, iterations, resume_from=None):
+        """
+        Train Kuhn Poker
+        :param iterations:  int - total iterations, including those a resumed checkpoint already ran. With a
+                                  convergence monitor this is the most that will be run
+        :param resume_from: str - checkpoint file to continue from
+        :return:
+        """
+        if resume_from:
+            self.resume(resume_from)
+        if self.gen_graphs:
+            self.trace = self._open_trace(iterations)
+        if self.checkpoint_every:
+            path = self.checkpoint_path or self.base_dir + kuhnHelper.CHECKPOINT_FILE
+            self.checkpoint = CheckpointWriter(path, self.checkpoint_every)
+        if self.stats:
+            self.stats.start(self.iteration)
+        try:
+            if self.convergence:
+                self._train_until_converged(iterations)
+            else:
+                self.util += self._run_iterations(iterations - self.iteration)
+        finally:
+            if self.stats:
+                self.stats.close(self.iteration)
+            # Last, so a failed checkpoint write raised by close() leaves nothing else open
+            if self.checkpoint:
+                checkpoint, self.checkpoint = self.checkpoint, None
+                checkpoint.close()
+
+        print('Average game value: {}'.format(self.util / self.iteration))
+        strategy_profile = self._average_strategy_profile()
 
         if self.gen_graphs:
-            # For large iterations use _save_training to export data into csv
-            #kuhnHelper._save_training_data(self.node_map, self.base_dir)
-            kuhnHelper.plot_strat_and_regret(self.node_map, self.base_dir)
+            # For csv exports of the trace use kuhnHelper._save_training_data
+            self._close_trace()
 
         return self._return_player_strats(strategy_profile)
@@ -0,0 +1,178 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+from multiplayer.kuhnGame import DEFAULT_GAME
+from multiplayer.multiPlayerKuhnTrainer import KuhnTrainer, TrainerInfoSet
+from multiplayer.vectorizedKuhnTrainer import VectorizedKuhnTrainer
+
+# Frozen strategy profile of a best response worker, attached once per process by _attach_frozen_profile
+_frozen_memory = None
+_frozen_profile = None
+# Trainer settings of a shard worker, sent once per process by _attach_config
+_shard_config = None
+
+
+def _worker_seed(seed, worker, sync_round):
+    # Every (worker, round) pair gets its own reproducible stream, independent of scheduling
+    return int(np.random.SeedSequence([seed, worker, sync_round]).generate_state(1)[0])
+
+
+def _attach_config(config):
+    """
+    Pool initializer: keep the trainer settings in the worker, so tasks only carry the tables
+    """
+    global _shard_config
+    _shard_config = config
+
+
+def _train_shard(info_sets, regret_sum, strategy_sum, iterations, seed):
+    """
+    Worker task: continue training from the merged tables and send back what this shard added to them
+    :return: info_sets list[str], regret delta np.array, strategy delta np.array, summed root utilities np.array
+    """
+    trainer = KuhnTrainer(seed=seed, **_shard_config)
+    trainer.load_tables(info_sets, regret_sum, strategy_sum)
+    util = trainer._run_iterations(iterations)
+
+    store = trainer.store
+    regret_delta = store.regret_sum[:len(store)].copy()
+    strategy_delta = store.strategy_sum[:len(store)].copy()
+    regret_delta[:len(info_sets)] -= regret_sum
+    strategy_delta[:len(info_sets)] -= strategy_sum
+    return store.info_sets, regret_delta, strategy_delta, util
+
+
+class ParallelKuhnTrainer(KuhnTrainer):
+    """
+    Shards CFR iterations across a process pool. Each worker trains on its own copy of the info set tables, starting
+    from the merged regret_sum and strategy_sum, for sync_interval iterations. The parent then adds every worker's
+    increments to the merged tables and starts the next round, until each worker has run its share of the iterations.
+
+    Worker w in round r shuffles deals with a generator seeded from (seed, w, r), so a run with the same seed, number
+    of workers and sync interval is reproducible.
+    """
+
+    def __init__(self, training_best_response=False, best_response_player=None, strategy_profile=None, generate_graphs=False, base_dir=None, seed=0,
+                 workers=None, sync_interval=10000, trace_every=None, checkpoint_every=None, checkpoint_path=None,
+                 update_rule='vanilla', sampling='chance', game=None, convergence=None):
+        if generate_graphs:
+            raise ValueError('Graph generation is not supported with parallel training')
+        if checkpoint_every:
+            raise ValueError('Checkpointing is not supported with parallel training')
+        if update_rule != 'vanilla':
+            # Shards count their own iterations, so discounting and alternation would not line up across workers
+            raise ValueError('Only vanilla CFR updates are supported with parallel training')
+        super().__init__(training_best_response, best_response_player, strategy_profile, generate_graphs, base_dir, seed,
+                         trace_every, sampling=sampling, game=game, convergence=convergence)
+        self.seed = seed
+        self.workers = workers or os.cpu_count()
+        self.sync_interval = sync_interval
+        # Counted across calls of _run_iterations, so training in slices never reuses a worker's seed
+        self.sync_round = 0
+        # Open for the length of a train call and shared by all of its slices
+        self.pool = None
+
+    def _merge(self, info_sets, regret_delta, strategy_delta):
+        for info_set in info_sets:
+            if info_set not in self.node_map:
+                self.node_map[info_set] = TrainerInfoSet(info_set, self.store)
+        rows = [self.store.index[info_set] for info_set in info_sets]
+        self.store.regret_sum[rows] += regret_delta
+        self.store.strategy_sum[rows] += strategy_delta
+
+    def resume(self, path):
+        raise ValueError('Resuming from a checkpoint is not supported with parallel training')
+
+    def _open_pool(self):
+        config = {'training_best_response': self.training_best_response,
+                  'best_response_player': self.best_response_player,
+                  'strategy_profile': self.strategy_profile,
+                  'sampling': self.sampling,
+                  'game': self.game}
+        return ProcessPoolExecutor(self.workers, initializer=_attach_config, initargs=(config,))
+
+    def train(self, iterations, resume_from=None):
+        self.pool = self._open_pool()
+        try:
+            return super().train(iterations, resume_from)
+        finally:
+            self.pool.shutdown()
+            self.pool = None
+
+    def _run_iterations(self, iterations):
+        if self.pool is None:
+            # Called outside of train, the pool only lives for this call
+            self.pool = self._open_pool()
+            try:
+                return self._run_iterations(iterations)
+            finally:
+                self.pool.shutdown()
+                self.pool = None
+
+        pool = self.pool
+        shares = [iterations // self.workers + (1 if w < iterations % self.workers else 0) for w in range(self.workers)]
+        util = 0
+        while any(shares):
+            # Snapshot copies: tasks are pickled in the background while earlier results are being merged
+            info_sets = list(self.store.info_sets)
+            regret_sum = self.store.regret_sum[:len(info_sets)].copy()
+            strategy_sum = self.store.strategy_sum[:len(info_sets)].copy()
+            tasks = [(w, min(share, self.sync_interval)) for w, share in enumerate(shares) if share]
+            futures = [pool.submit(_train_shard, info_sets, regret_sum, strategy_sum, n,
+                                   _worker_seed(self.seed, w, self.sync_round)) for w, n in tasks]
+            # Merge in worker order so the summed tables do not depend on which worker finishes first
+            for (w, n), future in zip(tasks, futures):
+                shard_info_sets, regret_delta, strategy_delta, shard_util = future.result()
+                self._merge(shard_info_sets, regret_delta, strategy_delta)
+                util += shard_util
+                shares[w] -= n
+            self.sync_round += 1
+        self.iteration += iterations
+        return util
+
+
+def _attach_frozen_profile(memory_name, info_sets, num_actions):
+    """
+    Pool initializer: map the shared strategy matrix into this process. Profile values are row views into shared
+    memory, so the opponents' strategy is never copied or pickled per task
+    """
+    global _frozen_memory, _frozen_profile
+    _frozen_memory = shared_memory.SharedMemory(name=memory_name)
+    matrix = np.ndarray((len(info_sets), num_actions), dtype=np.float64, buffer=_frozen_memory.buf)
+    _frozen_profile = {info_set: matrix[i] for i, info_set in enumerate(info_sets)}
+
+
+def _train_best_response(player, iterations, vectorized, game):
+    trainer = VectorizedKuhnTrainer if vectorized else KuhnTrainer
+    return trainer(training_best_response=True,
+                   best_response_player=player,
+                   strategy_profile=_frozen_profile,
+                   game=game).train(iterations)
+
+
+def train_best_responses(strategy_profile, iterations, vectorized=False, game=DEFAULT_GAME):
+    """
+    Train a best response for every player concurrently, one process per player, against the same frozen profile
+    :param strategy_profile: dict {str: list[float]} - profile the opponents keep playing
+    :param iterations:       int
+    :param vectorized:       bool - train each best response with VectorizedKuhnTrainer
+    :param game:             KuhnGame
+    :return: list[dict] - best response strategies in player order
+    """
+    info_sets = sorted(strategy_profile)
+    num_actions = KuhnTrainer.NUM_ACTIONS
+    players = list(range(game.num_players))
+    memory = shared_memory.SharedMemory(create=True, size=len(info_sets) * num_actions * np.float64().itemsize)
+    try:
+        matrix = np.ndarray((len(info_sets), num_actions), dtype=np.float64, buffer=memory.buf)
+        matrix[:] = [strategy_profile[info_set] for info_set in info_sets]
+        del matrix
+
+        with ProcessPoolExecutor(len(players), initializer=_attach_frozen_profile,
+                                 initargs=(memory.name, info_sets, num_actions)) as pool:
+            return list(pool.map(_train_best_response, players, [iterations] * len(players),
+                                 [vectorized] * len(players), [game] * len(players)))
+    finally:
+        memory.close()
+        memory.unlink()
@@ -0,0 +1,128 @@
+import argparse
+import pickle
+import struct
+from collections.abc import Mapping
+import numpy as np
+
+# File layout, little endian:
+#   header  - magic, format version, bytes per probability (4 or 8), info sets, actions, bytes of the index
+#   index   - sorted info set names, utf-8, separated by newlines
+#   padding - zeros up to the next multiple of ALIGNMENT
+#   matrix  - (info sets, actions) action probabilities, row i belongs to the ith info set of the index
+MAGIC = b'KUHNSTRT'
+VERSION = 1
+HEADER = struct.Struct('<8sIIQIQ')
+ALIGNMENT = 64
+DTYPES = {4: np.dtype('<f4'), 8: np.dtype('<f8')}
+
+
+class StrategyProfile(Mapping):
+    """
+    Read-only strategy profile over a matrix of action probabilities, usable wherever a dict {str: list[float]}
+    profile is read. Looking an info set up returns its row of the matrix, which is memory mapped when the profile
+    comes from load_profile, so processes loading the same file share one copy of it
+    """
+
+    def __init__(self, info_sets, matrix):
+        self.info_sets = info_sets
+        self.index = {info_set: i for i, info_set in enumerate(info_sets)}
+        self.matrix = matrix
+
+    def __getitem__(self, info_set):
+        return self.matrix[self.index[info_set]]
+
+    def __iter__(self):
+        return iter(self.info_sets)
+
+    def __len__(self):
+        return len(self.info_sets)
+
+    def to_dict(self):
+        """
+        :return: dict {str: list[float]} - the in-memory format trainers produce
+        """
+        return dict(zip(self.info_sets, self.matrix.tolist()))
+
+
+def save_profile(path, strategy_profile, dtype=np.float64):
+    """
+    :param path:             str
+    :param strategy_profile: dict {str: list[float]}
+    :param dtype:            np.float32 or np.float64 - storage precision of the probabilities
+    """
+    dtype = np.dtype(dtype)
+    if dtype.itemsize not in DTYPES:
+        raise ValueError('Strategies are stored as float32 or float64, not {}'.format(dtype))
+    info_sets = sorted(strategy_profile)
+    matrix = np.array([strategy_profile[info_set] for info_set in info_sets], dtype=DTYPES[dtype.itemsize])
+    num_actions = matrix.shape[1] if len(info_sets) else 0
+    index = '\n'.join(info_sets).encode('utf-8')
+
+    header = HEADER.pack(MAGIC, VERSION, dtype.itemsize, len(info_sets), num_actions, len(index))
+    padding = -(len(header) + len(index)) % ALIGNMENT
+    with open(path, 'wb') as f:
+        f.write(header)
+        f.write(index)
+        f.write(b'\0' * padding)
+        f.write(matrix.tobytes())
+
+
+def load_profile(path, mmap=True):
+    """
+    :param path: str
+    :param mmap: bool - map the matrix read-only instead of reading it into memory
+    :return: StrategyProfile
+    """
+    with open(path, 'rb') as f:
+        magic, version, itemsize, num_info_sets, num_actions, index_size = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError('{} is not a strategy profile file'.format(path))
+        if version != VERSION:
+            raise ValueError('Unsupported strategy profile version {} in {}'.format(version, path))
+        index = f.read(index_size).decode('utf-8')
+
+    info_sets = index.split('\n') if num_info_sets else []
+    offset = HEADER.size + index_size
+    offset += -offset % ALIGNMENT
+    shape = (num_info_sets, num_actions)
+    if mmap and num_info_sets:
+        matrix = np.memmap(path, dtype=DTYPES[itemsize], mode='r', offset=offset, shape=shape)
+    else:
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            matrix = np.fromfile(f, dtype=DTYPES[itemsize], count=num_info_sets * num_actions).reshape(shape)
+    return StrategyProfile(info_sets, matrix)
+
+
+def pickle_to_profile(pickle_path, path, dtype=np.float64):
+    """
+    Convert a profile saved by kuhnHelper.save_results
+    :param pickle_path: str
+    :param path:        str
+    :param dtype:       np.float32 or np.float64
+    """
+    with open(pickle_path, 'rb') as f:
+        save_profile(path, pickle.load(f), dtype)
+
+
+def profile_to_pickle(path, pickle_path):
+    """
+    Convert back to the pickled dict that kuhnHelper.load_trained_models reads
+    :param path:        str
+    :param pickle_path: str
+    """
+    with open(pickle_path, 'wb') as f:
+        pickle.dump(load_profile(path, mmap=False).to_dict(), f)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert strategy profiles between pickle and the binary format')
+    parser.add_argument('source')
+    parser.add_argument('destination')
+    parser.add_argument('--to-pickle', action='store_true', help='convert a binary profile back to a pickle')
+    parser.add_argument('--float32', action='store_true', help='store probabilities in single precision')
+    args = parser.parse_args()
+    if args.to_pickle:
+        profile_to_pickle(args.source, args.destination)
+    else:
+        pickle_to_profile(args.source, args.destination, np.float32 if args.float32 else np.float64)
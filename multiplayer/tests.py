@@ -1,4 +1,18 @@
+import itertools
+import tempfile
+from functools import partial
+from timeit import timeit
+import numpy as np
+from multiplayer.kuhnGame import DEFAULT_GAME
+from multiplayer.kuhnGame import KuhnGame
+from multiplayer.kuhnGameTree import GAME_TREE, KuhnGameTree
+from multiplayer.strategyFile import save_profile, load_profile
 from multiplayer.multiPlayerKuhnTrainer import KuhnTrainer
+from multiplayer.vectorizedKuhnTrainer import VectorizedKuhnTrainer
+from multiplayer.parallelKuhnTrainer import ParallelKuhnTrainer, train_best_responses
+from multiplayer.updateRules import UPDATE_RULES
+from multiplayer.convergence import ConvergenceMonitor
+from multiplayer import exploitability, bestResponse
 
 """
 Round 3 - Player Z Utility for Winning and Losing Hands
@@ -37,24 +51,196 @@ PPBBP_RESULTS = [-1, -1]
 PPBBB_RESULTS = [4, -2]
 ROUND5 = [R5_Y_WIN, R5_Y_LOSE]
 
+
+
+def _calculate_terminal_payoff(plays, history, cards):
+    # Utility of the last player to act, looked up in the compiled payoff table
+    utility = GAME_TREE.terminal_payoff(GAME_TREE.node_ids[history], GAME_TREE.deal_id(cards))
+    return utility[(plays - 1) % 3]
+
+
 """
 Test all rounds
 """
-t = KuhnTrainer()
 for i in range(2):
     # Round 3
-    assert t._calculate_terminal_payoff(plays=3, history='ppp', cards=ROUND3[i]) == PPP_RESULTS[i]
-    assert t._calculate_terminal_payoff(plays=3, history='bpp', cards=ROUND3[i]) == BPP_RESULTS[i]
-    assert t._calculate_terminal_payoff(plays=3, history='bpb', cards=ROUND3[i]) == BPB_RESULTS[i]
-    assert t._calculate_terminal_payoff(plays=3, history='bbp', cards=ROUND3[i]) == BBP_RESULTS[i]
-    assert t._calculate_terminal_payoff(plays=3, history='bbb', cards=ROUND3[i]) == BBB_RESULTS[i]
+    assert _calculate_terminal_payoff(plays=3, history='ppp', cards=ROUND3[i]) == PPP_RESULTS[i]
+    assert _calculate_terminal_payoff(plays=3, history='bpp', cards=ROUND3[i]) == BPP_RESULTS[i]
+    assert _calculate_terminal_payoff(plays=3, history='bpb', cards=ROUND3[i]) == BPB_RESULTS[i]
+    assert _calculate_terminal_payoff(plays=3, history='bbp', cards=ROUND3[i]) == BBP_RESULTS[i]
+    assert _calculate_terminal_payoff(plays=3, history='bbb', cards=ROUND3[i]) == BBB_RESULTS[i]
     # Round 4
-    assert t._calculate_terminal_payoff(plays=4, history='pbpp', cards=ROUND4[i]) == PBPP_RESULTS[i]
-    assert t._calculate_terminal_payoff(plays=4, history='pbpb', cards=ROUND4[i]) == PBPB_RESULTS[i]
-    assert t._calculate_terminal_payoff(plays=4, history='pbbp', cards=ROUND4[i]) == PBBP_RESULTS[i]
-    assert t._calculate_terminal_payoff(plays=4, history='pbbb', cards=ROUND4[i]) == PBBB_RESULTS[i]
+    assert _calculate_terminal_payoff(plays=4, history='pbpp', cards=ROUND4[i]) == PBPP_RESULTS[i]
+    assert _calculate_terminal_payoff(plays=4, history='pbpb', cards=ROUND4[i]) == PBPB_RESULTS[i]
+    assert _calculate_terminal_payoff(plays=4, history='pbbp', cards=ROUND4[i]) == PBBP_RESULTS[i]
+    assert _calculate_terminal_payoff(plays=4, history='pbbb', cards=ROUND4[i]) == PBBB_RESULTS[i]
     # Round 5
-    assert t._calculate_terminal_payoff(plays=5, history='ppbpp', cards=ROUND5[i]) == PPBPP_RESULTS[i]
-    assert t._calculate_terminal_payoff(plays=5, history='ppbpb', cards=ROUND5[i]) == PPBPB_RESULTS[i]
-    assert t._calculate_terminal_payoff(plays=5, history='ppbbp', cards=ROUND5[i]) == PPBBP_RESULTS[i]
-    assert t._calculate_terminal_payoff(plays=5, history='ppbbb', cards=ROUND5[i]) == PPBBB_RESULTS[i]
\ No newline at end of file
+    assert _calculate_terminal_payoff(plays=5, history='ppbpp', cards=ROUND5[i]) == PPBPP_RESULTS[i]
+    assert _calculate_terminal_payoff(plays=5, history='ppbpb', cards=ROUND5[i]) == PPBPB_RESULTS[i]
+    assert _calculate_terminal_payoff(plays=5, history='ppbbp', cards=ROUND5[i]) == PPBBP_RESULTS[i]
+    assert _calculate_terminal_payoff(plays=5, history='ppbbb', cards=ROUND5[i]) == PPBBB_RESULTS[i]
+"""
+The payoff table agrees with the rules of the game for every terminal history and deal
+"""
+LEAVES = [(z, d) for z in GAME_TREE.terminal_nodes.tolist() for d in range(len(GAME_TREE.deals))]
+for z, d in LEAVES:
+    assert GAME_TREE.terminal_payoff(z, d) == DEFAULT_GAME.terminal_payoff(GAME_TREE.histories[z], GAME_TREE.deals[d].tolist())
+
+"""
+Leaf evaluation microbenchmark - evaluating the rules at every leaf visit against the table lookup
+"""
+DEALS = GAME_TREE.deals.tolist()
+rules = timeit(lambda: [DEFAULT_GAME.terminal_payoff(GAME_TREE.histories[z], DEALS[d]) for z, d in LEAVES], number=200)
+table = timeit(lambda: [GAME_TREE.terminal_payoff(z, d) for z, d in LEAVES], number=200)
+print('Leaf evaluation per visit - rules: {:.3f}us table: {:.3f}us'.format(rules / (200 * len(LEAVES)) * 1e6,
+                                                                           table / (200 * len(LEAVES)) * 1e6))
+
+"""
+Binary strategy files load back the profile they were saved from
+"""
+PROFILE = {info_set: [0.25, 0.75] for n in GAME_TREE.decision_nodes for info_set in GAME_TREE.info_set_names[n].values()}
+with tempfile.TemporaryDirectory() as tmp:
+    for dtype in (np.float32, np.float64):
+        save_profile(tmp + '/profile.kst', PROFILE, dtype)
+        loaded = load_profile(tmp + '/profile.kst')
+        assert sorted(loaded) == sorted(PROFILE) and loaded.matrix.dtype == dtype
+        assert loaded.to_dict() == PROFILE
+
+"""
+Chance sampling CFR converges: regrets are weighted by the reach of every opponent, not just one of them
+"""
+CFR_PROFILE = KuhnTrainer(seed=1).train(20000)
+assert exploitability.nash_conv(CFR_PROFILE) < 0.03
+
+"""
+Monte Carlo CFR converges too: external and outcome sampling get well below the uniform profile's NashConv of 2.06
+"""
+for sampling, bound in (('external', 0.05), ('outcome', 0.1)):
+    SAMPLING_TRAINER = KuhnTrainer(seed=1, sampling=sampling)
+    EARLY_NASH_CONV = exploitability.nash_conv(SAMPLING_TRAINER.train(5000))
+    assert exploitability.nash_conv(SAMPLING_TRAINER.train(20000)) < min(bound, EARLY_NASH_CONV)
+
+"""
+Every update rule converges with sampled deals, and CFR+ and Discounted CFR beat vanilla CFR when every deal is traversed
+"""
+FULL_WIDTH_NASH_CONV = {}
+for rule in UPDATE_RULES:
+    assert exploitability.nash_conv(KuhnTrainer(seed=1, update_rule=rule).train(10000)) < 0.1, rule
+    FULL_WIDTH_NASH_CONV[rule] = exploitability.nash_conv(VectorizedKuhnTrainer(update_rule=rule).train(1000))
+    assert FULL_WIDTH_NASH_CONV[rule] < 0.03, rule
+assert FULL_WIDTH_NASH_CONV['cfr+'] < FULL_WIDTH_NASH_CONV['vanilla'] / 10
+assert FULL_WIDTH_NASH_CONV['discounted'] < FULL_WIDTH_NASH_CONV['vanilla'] / 10
+
+"""
+The convergence monitor stops the default trainer once its average strategy is within the target NashConv
+"""
+MONITOR = ConvergenceMonitor(every=2000, target=0.02)
+KuhnTrainer(seed=1, convergence=MONITOR).train(100000)
+assert MONITOR.stopped_at is not None and MONITOR.stopped_at < 100000
+assert MONITOR.curve[-1] == (MONITOR.stopped_at, MONITOR.curve[-1][1]) and MONITOR.curve[-1][1] <= 0.02
+assert all(value > 0.02 for _, value in MONITOR.curve[:-1])
+
+
+"""
+Exact evaluation gives the same result whether the deals are processed in one chunk or many small ones
+"""
+WHOLE_TREE = KuhnGameTree(KuhnGame(3, 4))
+CHUNKED_TREE = KuhnGameTree(KuhnGame(3, 4))
+CHUNKED_TREE.chunk_size = 5
+assert len(WHOLE_TREE.deal_chunks()) == 1 and len(CHUNKED_TREE.deal_chunks()) == 5
+CHUNK_PROFILE = VectorizedKuhnTrainer(game=KuhnGame(3, 4)).train(100)
+assert bestResponse.compute_best_responses(CHUNK_PROFILE, WHOLE_TREE) == \
+    bestResponse.compute_best_responses(CHUNK_PROFILE, CHUNKED_TREE)
+assert np.allclose(exploitability.best_response_gains(CHUNK_PROFILE, tree=WHOLE_TREE),
+                   exploitability.best_response_gains(CHUNK_PROFILE, tree=CHUNKED_TREE))
+assert np.allclose(exploitability.expected_utilities(CHUNK_PROFILE, WHOLE_TREE),
+                   exploitability.expected_utilities(CHUNK_PROFILE, CHUNKED_TREE))
+WHOLE_UTILITIES = exploitability.info_set_utilities(CHUNK_PROFILE, WHOLE_TREE)
+CHUNKED_UTILITIES = exploitability.info_set_utilities(CHUNK_PROFILE, CHUNKED_TREE)
+assert list(WHOLE_UTILITIES) == list(CHUNKED_UTILITIES)
+assert np.allclose(list(WHOLE_UTILITIES.values()), list(CHUNKED_UTILITIES.values()))
+
+"""
+A run resumed from a checkpoint after k iterations ends with exactly the profile of an uninterrupted run
+"""
+RESUMABLE_TRAINERS = {'chance': partial(KuhnTrainer, seed=1),
+                      'outcome': partial(KuhnTrainer, seed=1, sampling='outcome'),
+                      'cfr+': partial(KuhnTrainer, seed=1, update_rule='cfr+'),
+                      'vectorized': VectorizedKuhnTrainer}
+with tempfile.TemporaryDirectory() as tmp:
+    for name, trainer in RESUMABLE_TRAINERS.items():
+        total, k = (30, 10) if name == 'vectorized' else (3000, 1000)
+        trainer(checkpoint_every=k, checkpoint_path=tmp + '/checkpoint.npz').train(k)
+        assert trainer().train(total, resume_from=tmp + '/checkpoint.npz') == trainer().train(total)
+
+"""
+Checkpointing needs somewhere to write, and a failed background write is raised by train
+"""
+try:
+    KuhnTrainer(checkpoint_every=100)
+    assert False, 'checkpoint_every without a path or base_dir was accepted'
+except ValueError:
+    pass
+with tempfile.TemporaryDirectory() as tmp:
+    try:
+        KuhnTrainer(seed=1, checkpoint_every=100, checkpoint_path=tmp + '/missing/checkpoint.npz').train(200)
+        assert False, 'the failed checkpoint write was not raised'
+    except FileNotFoundError:
+        pass
+
+
+def _pure_strategy_values(strategy_profile, info_sets, player, tree):
+    # Utility of player for every pure strategy over info_sets, the rest of the profile unchanged
+    return [exploitability.expected_utilities({**strategy_profile,
+                                               **{i: [1.0 - a, float(a)] for i, a in zip(info_sets, actions)}},
+                                              tree)[player]
+            for actions in itertools.product((0, 1), repeat=len(info_sets))]
+
+
+def _brute_force_best_response_values(strategy_profile, tree, by_card=False):
+    """
+    Best response value of every player by enumerating pure strategies. A player's info sets for different cards never
+    meet in a deal, so with by_card the 2 ** (info sets per card) strategies of each card are enumerated separately and
+    the best of each card combined, which is still exact but tractable for 16 info sets per player
+    """
+    values = []
+    for player in range(tree.num_players):
+        nodes = [n for n in tree.decision_nodes if tree.player[n] == player]
+        by_name = {c: [tree.info_set_names[n][c] for n in nodes] for c in tree.info_set_names[nodes[0]]}
+        groups = list(by_name.values()) if by_card else [sum(by_name.values(), [])]
+        profile_value = exploitability.expected_utilities(strategy_profile, tree)[player]
+        values.append(profile_value + sum(max(_pure_strategy_values(strategy_profile, info_sets, player, tree)) -
+                                          profile_value for info_sets in groups))
+    return np.array(values)
+
+
+"""
+Exact best responses match enumerating every pure strategy. The two player, three card equilibrium with alpha = 0 is
+worth -1/18 to the first player and neither player gains by deviating from it
+"""
+TWO_PLAYER_TREE = KuhnGameTree(KuhnGame(2, 3))
+TWO_PLAYER_NASH = {'1': [1, 0], '1pb': [1, 0], '2': [1, 0], '2pb': [2 / 3, 1 / 3], '3': [1, 0], '3pb': [0, 1],
+                   '1p': [2 / 3, 1 / 3], '1b': [1, 0], '2p': [1, 0], '2b': [2 / 3, 1 / 3], '3p': [0, 1], '3b': [0, 1]}
+assert np.allclose(exploitability.expected_utilities(TWO_PLAYER_NASH, TWO_PLAYER_TREE), [-1 / 18, 1 / 18])
+assert np.allclose(_brute_force_best_response_values(TWO_PLAYER_NASH, TWO_PLAYER_TREE), [-1 / 18, 1 / 18])
+assert abs(exploitability.nash_conv(TWO_PLAYER_NASH, tree=TWO_PLAYER_TREE)) < 1e-12
+TWO_PLAYER_UNIFORM = {i: [0.5, 0.5] for i in TWO_PLAYER_TREE.info_sets}
+assert np.allclose(exploitability.best_response_gains(TWO_PLAYER_UNIFORM, tree=TWO_PLAYER_TREE)[1],
+                   _brute_force_best_response_values(TWO_PLAYER_UNIFORM, TWO_PLAYER_TREE))
+for profile in (CFR_PROFILE, CHUNK_PROFILE):
+    BRUTE_FORCE_VALUES = _brute_force_best_response_values(profile, GAME_TREE, by_card=True)
+    PROFILE_VALUES, BR_VALUES = exploitability.best_response_gains(profile)
+    assert np.allclose(BR_VALUES, BRUTE_FORCE_VALUES)
+    assert np.isclose(exploitability.nash_conv(profile), (BRUTE_FORCE_VALUES - PROFILE_VALUES).sum())
+
+"""
+Sharded training is reproducible for a seed, and best responses trained concurrently against the profile in shared
+memory are the ones trained one after another in this process
+"""
+PARALLEL_PROFILE = ParallelKuhnTrainer(seed=3, workers=2, sync_interval=500).train(2000)
+assert ParallelKuhnTrainer(seed=3, workers=2, sync_interval=500).train(2000) == PARALLEL_PROFILE
+assert ParallelKuhnTrainer(seed=4, workers=2, sync_interval=500).train(2000) != PARALLEL_PROFILE
+SERIAL_BEST_RESPONSES = [VectorizedKuhnTrainer(training_best_response=True, best_response_player=player,
+                                               strategy_profile=PARALLEL_PROFILE).train(20)
+                         for player in range(DEFAULT_GAME.num_players)]
+assert train_best_responses(PARALLEL_PROFILE, 20, vectorized=True) == SERIAL_BEST_RESPONSES
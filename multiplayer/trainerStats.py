@@ -0,0 +1,92 @@
+import json
+import time
+from collections import Counter
+
+
+class TrainerStats:
+    """
+    Opt-in instrumentation of a KuhnTrainer. The trainer's traversals only report to it when one is passed as stats,
+    otherwise the hot paths cost one comparison against None per visit.
+
+    Every `every` iterations a snapshot is handed to the callback and/or appended to a JSON lines log:
+        iteration, elapsed            - iterations done, wall clock seconds since training started
+        iterations_per_sec            - rate since the previous snapshot
+        node_visits                   - decision nodes visited so far
+        terminal_evaluations          - terminal payoffs looked up so far
+        regret_matching_seconds       - time spent looking up info sets and matching regrets
+        traversal_seconds             - the rest of the training time
+        info_set_visits               - visits so far per info set (with info_set_visits=True)
+
+    The vectorized trainer updates every info set at once, only its iteration rate is reported.
+    """
+
+    def __init__(self, every=1000, callback=None, log_path=None, info_set_visits=True):
+        self.every = every
+        self.callback = callback
+        self.log_path = log_path
+        self.info_set_visits = info_set_visits
+        self.visits = Counter()
+        self.terminal_evaluations = 0
+        self.regret_matching_seconds = 0.0
+        self.snapshots = []
+        self._log = None
+        self._start = None
+        self._last = None
+
+    def start(self, iteration):
+        """
+        Start the clocks, called by KuhnTrainer.train
+        :param iteration: int - iterations the trainer has already run
+        """
+        if self.log_path and self._log is None:
+            self._log = open(self.log_path, 'a')
+        self._start = time.perf_counter()
+        self._last = (iteration, self._start)
+
+    def visit(self, info_set, seconds):
+        """
+        :param info_set: str   - info set of a visited decision node
+        :param seconds:  float - time spent finding its strategy
+        """
+        self.visits[info_set] += 1
+        self.regret_matching_seconds += seconds
+
+    def record(self, iteration):
+        if iteration % self.every == 0:
+            self.snapshot(iteration)
+
+    def snapshot(self, iteration):
+        """
+        Emit the counters as they are now
+        :param iteration: int
+        :return: dict
+        """
+        now = time.perf_counter()
+        last_iteration, last_time = self._last
+        elapsed = now - self._start
+        snapshot = {'iteration': iteration,
+                    'elapsed': elapsed,
+                    'iterations_per_sec': (iteration - last_iteration) / (now - last_time) if now > last_time else 0.0,
+                    'node_visits': sum(self.visits.values()),
+                    'terminal_evaluations': self.terminal_evaluations,
+                    'regret_matching_seconds': self.regret_matching_seconds,
+                    'traversal_seconds': elapsed - self.regret_matching_seconds}
+        if self.info_set_visits:
+            snapshot['info_set_visits'] = dict(self.visits)
+        self._last = (iteration, now)
+
+        self.snapshots.append(snapshot)
+        if self.callback:
+            self.callback(snapshot)
+        if self._log:
+            self._log.write(json.dumps(snapshot) + '\n')
+            self._log.flush()
+        return snapshot
+
+    def close(self, iteration):
+        # Final snapshot unless the last iteration already produced one
+        if self._last[0] != iteration:
+            self.snapshot(iteration)
+        if self._log:
+            self._log.close()
+            self._log = None
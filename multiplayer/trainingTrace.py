@@ -0,0 +1,105 @@
+import json
+import os
+import numpy as np
+
+META_FILE = 'meta.json'
+COLUMNS = ['iteration', 'strategy', 'regret']
+
+
+class TraceWriter:
+    """
+    Streams training snapshots to disk. Every `every` iterations the average strategy and cumulative regret of every
+    info set are buffered, and each `chunk_size` snapshots are written as one append-only chunk per column:
+        iteration_00000.npy  (snapshots,)
+        strategy_00000.npy   (snapshots, info sets, actions)
+        regret_00000.npy     (snapshots, info sets, actions)
+    Memory use is bounded by one chunk however long training runs.
+    """
+
+    def __init__(self, directory, info_sets, num_actions=2, every=1000, chunk_size=1024):
+        self.directory = directory
+        self.info_sets = list(info_sets)
+        self.num_actions = num_actions
+        self.every = every
+        self.chunk_size = chunk_size
+        self.chunks = 0
+        self._rows = None
+        self._buffer = {column: [] for column in COLUMNS}
+
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, META_FILE), 'w') as f:
+            json.dump({'info_sets': self.info_sets, 'num_actions': num_actions, 'every': every}, f)
+
+    def _store_rows(self, store):
+        # Info sets are added to a store as they are first visited, so rows are looked up until all of them exist
+        if self._rows is not None:
+            return self._rows
+        rows = np.array([store.index.get(info_set, -1) for info_set in self.info_sets])
+        if (rows >= 0).all():
+            self._rows = rows
+        return rows
+
+    def record(self, iteration, store):
+        """
+        Snapshot an InfoSetStore when iteration is a multiple of every
+        :param iteration: int - iterations completed
+        :param store: InfoSetStore
+        """
+        if iteration % self.every:
+            return
+
+        rows = self._store_rows(store)
+        seen = rows >= 0
+        strategy = np.full((len(rows), self.num_actions), 1.0 / self.num_actions)
+        regret = np.zeros((len(rows), self.num_actions))
+        strategy[seen] = store.get_average_strategy()[rows[seen]]
+        regret[seen] = store.regret_sum[rows[seen]]
+
+        self._buffer['iteration'].append(iteration)
+        self._buffer['strategy'].append(strategy)
+        self._buffer['regret'].append(regret)
+        if len(self._buffer['iteration']) == self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if not self._buffer['iteration']:
+            return
+        for column in COLUMNS:
+            np.save(os.path.join(self.directory, '{}_{:05d}.npy'.format(column, self.chunks)), np.array(self._buffer[column]))
+            self._buffer[column] = []
+        self.chunks += 1
+
+    def close(self):
+        self.flush()
+
+
+class TraceReader:
+    """
+    Lazy reader for a trace directory. Chunks are memory-mapped and only the requested info set is copied out
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, META_FILE)) as f:
+            meta = json.load(f)
+        self.info_sets = meta['info_sets']
+        self.num_actions = meta['num_actions']
+        self.every = meta['every']
+        self.index = {info_set: i for i, info_set in enumerate(self.info_sets)}
+        self.chunks = len([f for f in os.listdir(directory) if f.startswith('iteration_')])
+
+    def _column(self, column, chunk):
+        return np.load(os.path.join(self.directory, '{}_{:05d}.npy'.format(column, chunk)), mmap_mode='r')
+
+    def iterations(self):
+        return np.concatenate([np.array(self._column('iteration', c)) for c in range(self.chunks)] or [np.zeros(0, dtype=int)])
+
+    def series(self, info_set, column):
+        """
+        :param info_set: str
+        :param column:   str - 'strategy' or 'regret'
+        :return: np.array (snapshots, actions)
+        """
+        i = self.index[info_set]
+        parts = [np.array(self._column(column, c)[:, i]) for c in range(self.chunks)]
+        return np.concatenate(parts) if parts else np.zeros((0, self.num_actions))
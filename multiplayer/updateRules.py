@@ -0,0 +1,80 @@
+import numpy as np
+
+
+class UpdateRule:
+    """
+    Vanilla CFR: raw cumulative regrets and a uniformly weighted average strategy.
+
+    Update rules act on the InfoSetStore at the end of every iteration t (1-based). With alternating updates only one
+    player (t - 1) % players accumulates regret and average strategy each iteration.
+
+    The faster rules pay off when every iteration traverses every deal (VectorizedKuhnTrainer). On the default game
+    CFR+ and Discounted CFR are then an order of magnitude less exploitable than vanilla CFR after 1000 iterations.
+    When each iteration samples a deal the sampling noise dominates, and every rule converges at about the rate of
+    vanilla CFR.
+    """
+    alternating = False
+
+    def end_iteration(self, store, t):
+        """
+        :param store: InfoSetStore
+        :param t:     int - iteration that just finished
+        """
+        pass
+
+
+class DiscountedCFR(UpdateRule):
+    """
+    Discounted CFR (Brown & Sandholm 2019). After iteration t positive regrets are multiplied by t^alpha / (t^alpha + 1),
+    negative regrets by t^beta / (t^beta + 1) and the strategy sum by (t / (t + 1))^gamma
+    """
+
+    def __init__(self, alpha=1.5, beta=0.0, gamma=2.0):
+        self.alpha = alpha
+        self.beta = beta
+        self.gamma = gamma
+
+    def end_iteration(self, store, t):
+        regret_sum = store.regret_sum[:len(store)]
+        positive = t ** self.alpha / (t ** self.alpha + 1)
+        negative = t ** self.beta / (t ** self.beta + 1)
+        regret_sum *= np.where(regret_sum > 0, positive, negative)
+        store.strategy_sum[:len(store)] *= (t / (t + 1)) ** self.gamma
+
+
+class LinearCFR(DiscountedCFR):
+    """
+    Linear CFR: iteration t contributes to regrets and the average strategy with weight t. Same as discounting
+    everything by t / (t + 1)
+    """
+
+    def __init__(self):
+        super().__init__(alpha=1.0, beta=1.0, gamma=1.0)
+
+
+class CFRPlus(UpdateRule):
+    """
+    CFR+: cumulative regrets are floored at zero, updates alternate between players and the average strategy is
+    weighted linearly by iteration
+    """
+    alternating = True
+
+    def end_iteration(self, store, t):
+        regret_sum = store.regret_sum[:len(store)]
+        np.maximum(regret_sum, 0, out=regret_sum)
+        store.strategy_sum[:len(store)] *= t / (t + 1)
+
+
+UPDATE_RULES = {'vanilla': UpdateRule, 'cfr+': CFRPlus, 'linear': LinearCFR, 'discounted': DiscountedCFR}
+
+
+def get_update_rule(update_rule):
+    """
+    :param update_rule: str or UpdateRule - one of UPDATE_RULES, or a configured instance such as DiscountedCFR(2, 0, 3)
+    :return: UpdateRule
+    """
+    if isinstance(update_rule, UpdateRule):
+        return update_rule
+    if update_rule not in UPDATE_RULES:
+        raise ValueError('Unknown update rule {}, expected one of {}'.format(update_rule, list(UPDATE_RULES)))
+    return UPDATE_RULES[update_rule]()
@@ -0,0 +1,153 @@
+import numpy as np
+from multiplayer.multiPlayerKuhnTrainer import KuhnTrainer, TrainerInfoSet, InfoSetStore
+
+
+class VectorizedKuhnTrainer(KuhnTrainer):
+    """
+    Chance-sampling-free CFR. Instead of walking the tree once per shuffled deal, every iteration evaluates the whole
+    tree for every deal at once with NumPy arrays indexed by (deal, node, player/action).
+
+    Every node is described by the path of actions that leads to it, so reach probabilities are a product over a
+    gathered (deal, node, depth) array and node utilities are a single contraction of terminal payoffs. Regrets are
+    accumulated per info set with np.bincount.
+
+    Counterfactual regret is weighted by the chance probability of the deal and the product of both opponents
+    reach probabilities.
+    """
+
+    def __init__(self, training_best_response=False, best_response_player=None, strategy_profile=None, generate_graphs=False, base_dir=None,
+                 trace_every=None, checkpoint_every=None, checkpoint_path=None, update_rule='vanilla', game=None,
+                 stats=None, convergence=None):
+        super().__init__(training_best_response, best_response_player, strategy_profile, generate_graphs, base_dir,
+                         trace_every=trace_every, checkpoint_every=checkpoint_every, checkpoint_path=checkpoint_path,
+                         update_rule=update_rule, game=game, stats=stats,
+                         convergence=convergence)
+        tree = self.tree
+        num_nodes = tree.num_nodes
+        self.decision_nodes = tree.decision_nodes
+        self.decision_player = tree.player[self.decision_nodes]
+        decision_position = {n: i for i, n in enumerate(self.decision_nodes)}
+
+        # Edge index of every action along the path to each node, padded with an edge that always has probability 1.
+        # Depth is padded to a whole number of betting rounds so reach can be split per player with a reshape
+        self.path_length = -(-tree.depth.max() // self.num_players) * self.num_players
+        one_edge = len(self.decision_nodes) * self.NUM_ACTIONS
+        self.path_index = np.full((num_nodes, self.path_length), one_edge)
+        for n in range(1, num_nodes):
+            child = n
+            while child != tree.ROOT:
+                p = tree.parent[child]
+                self.path_index[n, tree.depth[p]] = decision_position[p] * self.NUM_ACTIONS + tree.action[child]
+                child = p
+
+        # Terminal z contributes suffix[z, depth(n)] * payoff[z] to node n when n lies on the path to z. Otherwise it
+        # points at the padded end of the path, whose suffix product is 0. Stored as flat indices of (terminal, depth)
+        row = np.arange(len(tree.terminal_nodes)) * (self.path_length + 1)
+        self.descendant_index = np.tile(row + self.path_length, (num_nodes, 1))
+        for i, z in enumerate(tree.terminal_nodes):
+            n = z
+            while n != -1:
+                self.descendant_index[n, i] = row[i] + tree.depth[n]
+                n = tree.parent[n]
+        self.children = tree.children[self.decision_nodes]
+
+        # Every ordered deal of one card per player. Each deal is equally likely
+        self.deals = tree.deals
+        self.chance = 1.0 / len(self.deals)
+
+        # Info set ids: one row per (card, decision history) in the same order train() reports them
+        self.info_sets = tree.info_sets
+        info_set_ids = {info_set: i for i, info_set in enumerate(self.info_sets)}
+        self.info_set_index = tree.info_set_rows
+        self.action_index = (self.info_set_index[:, :, None] * self.NUM_ACTIONS + np.arange(self.NUM_ACTIONS)).ravel()
+
+        # Terminal payoffs for every (deal, terminal, player)
+        self.payoffs = tree.payoffs.transpose(1, 0, 2)
+        self.terminal_nodes = tree.terminal_nodes
+        self.num_nodes = num_nodes
+
+        # Opponents of the acting player at every decision node, used for counterfactual reach
+        self.opponent_mask = self.decision_player[:, None] != np.arange(self.num_players)[None, :]
+
+        # Every info set is known up front, so the store is allocated once at its final size
+        self.store = InfoSetStore(self.NUM_ACTIONS, capacity=len(self.info_sets))
+        self.node_map = {info_set: TrainerInfoSet(info_set, self.store) for info_set in self.info_sets}
+        self.regret_sum = self.store.regret_sum
+        self.strategy_sum = self.store.strategy_sum
+
+        # Best Response Strategies for opponents are pre-defined and provided to the class.
+        self.fixed = np.zeros(len(self.info_sets), dtype=bool)
+        self.fixed_strategy = np.zeros((len(self.info_sets), self.NUM_ACTIONS))
+        if self.training_best_response:
+            for info_set, i in info_set_ids.items():
+                if self.game.info_set_player(info_set) != self.best_response_player:
+                    self.fixed[i] = True
+                    self.fixed_strategy[i] = self.strategy_profile[info_set]
+
+    def get_strategy(self):
+        """
+        Regret matching for every info set at once
+        :return: np.array (info sets, actions)
+        """
+        positive_regret = np.maximum(self.regret_sum, 0)
+        normalizing_sum = positive_regret.sum(axis=1, keepdims=True)
+        strategy = np.divide(positive_regret, normalizing_sum,
+                             out=np.full_like(positive_regret, 1.0 / self.NUM_ACTIONS), where=normalizing_sum > 0)
+        strategy[self.fixed] = self.fixed_strategy[self.fixed]
+        return strategy
+
+    def cfr(self):
+        """
+        One iteration of CFR over every deal
+        :return: np.array - expected utility of the root for every player
+        """
+        num_deals = len(self.deals)
+        strategy = self.get_strategy()[self.info_set_index]
+        edges = np.concatenate([strategy.reshape(num_deals, -1), np.ones((num_deals, 1))], axis=1)
+        path = edges[:, self.path_index]
+
+        # Reach probabilities (deal, node, player): the acting player cycles with depth
+        reach = path.reshape(num_deals, self.num_nodes, -1, self.num_players).prod(axis=2)
+
+        # Utilities (deal, node, player): terminal payoffs weighted by the probability of reaching them from the node
+        suffix = np.cumprod(path[:, self.terminal_nodes, ::-1], axis=2)[:, :, ::-1]
+        suffix = np.concatenate([suffix, np.zeros((num_deals, len(self.terminal_nodes), 1))], axis=2)
+        utilities = suffix.reshape(num_deals, -1)[:, self.descendant_index] @ self.payoffs
+
+        nodes = self.decision_nodes
+        node_reach = reach[:, nodes]
+        counterfactual_reach = self.chance * np.prod(np.where(self.opponent_mask, node_reach, 1.0), axis=2)
+        own_reach = self.chance * node_reach[:, np.arange(len(nodes)), self.decision_player]
+        node_util = utilities[:, nodes, self.decision_player]
+        action_util = utilities[:, self.children, self.decision_player[:, None]]
+
+        regret = counterfactual_reach[:, :, None] * (action_util - node_util[:, :, None])
+        if self.traverser is not None:
+            # Alternating updates: only the traversing player's nodes accumulate regret and average strategy
+            updating = self.decision_player == self.traverser
+            regret = regret * updating[None, :, None]
+            own_reach = own_reach * updating[None, :]
+        size = self.regret_sum.size
+        self.regret_sum += np.bincount(self.action_index, weights=regret.ravel(), minlength=size).reshape(self.regret_sum.shape)
+        self.strategy_sum += np.bincount(self.action_index, weights=(own_reach[:, :, None] * strategy).ravel(),
+                                         minlength=size).reshape(self.strategy_sum.shape)
+
+        return self.chance * utilities[:, 0].sum(axis=0)
+
+    def load_tables(self, info_sets, regret_sum, strategy_sum):
+        # The store already holds every info set, and regret_sum / strategy_sum alias it, so rows are filled in place
+        rows = [self.store.index[info_set] for info_set in info_sets]
+        self.regret_sum[rows] = regret_sum
+        self.strategy_sum[rows] = strategy_sum
+
+    def _run_iterations(self, iterations):
+        """
+        Run full CFR iterations over every deal
+        :param iterations:
+        :return: np.array - summed root utilities for every player
+        """
+        util = 0
+        for _ in range(iterations):
+            util += self.cfr()
+            self._end_iteration(util)
+        return util